@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from PIL import Image
+
+from corpus import generate_corpus, quiet_logging
+from object_service import ObjectService
+
+
+def write_thumbnails(object_path: str, count: int, size: int, seed: int):
+    # 合成语料中的缩略图是空文件，这里写入真实的 jpg / webp
+    rnd = random.Random(seed)
+    size_dir = os.path.join(object_path, "images_square", str(size))
+    os.makedirs(size_dir, exist_ok=True)
+    for i in range(count):
+        img = Image.new("RGB", (size, size), tuple(rnd.randrange(256) for _ in range(3)))
+        for _ in range(8):
+            x, y = rnd.randrange(size), rnd.randrange(size)
+            img.paste(tuple(rnd.randrange(256) for _ in range(3)), (x, y, min(size, x + size // 4), min(size, y + size // 4)))
+        img.save(os.path.join(size_dir, f"{i}.jpg"), quality=85)
+        img.save(os.path.join(size_dir, f"{i}.webp"), quality=80)
+
+
+def requested(urls):
+    # 前端需要下载的文件数和字节数（相同 url 只下载一次）；url 相对当前目录
+    files = set(urls)
+    return len(files), sum(os.path.getsize(url.lstrip("/")) for url in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge graph images: one file per node vs sprite atlases.")
+    parser.add_argument("--squares", type=int, default=200, help="thumbnails per object")
+    parser.add_argument("--sizes", default="128,256")
+    parser.add_argument("--kg-depth", type=int, default=4)
+    parser.add_argument("--kg-breadth", type=int, default=6)
+    args = parser.parse_args()
+    quiet_logging()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 与服务一样使用相对路径 static/objects，url 即相对当前目录的路径
+        os.chdir(tmp)
+        base = "static/objects"
+        name = generate_corpus(base, 1, 1, 1, kg_depth=args.kg_depth, kg_breadth=args.kg_breadth)[0]
+        object_path = os.path.join(base, os.listdir(base)[0])
+        sizes = [int(s) for s in args.sizes.split(",")]
+        for size in sizes:
+            write_thumbnails(object_path, args.squares, size, size)
+
+        print(f"{'variant':<10} {'nodes':>6} {'files':>6} {'file KB':>8} {'sheets':>7} {'sheet KB':>9} "
+              f"{'build ms':>9} {'cached ms':>10}")
+        for size in sizes:
+            for fmt in ("jpg", "webp"):
+                service = ObjectService(base)
+                t = time.perf_counter()
+                data = service.get_knowledge_graph_data_ex(name, size, fmt, atlas=True)
+                build = time.perf_counter() - t
+                # 新的 ObjectService 从磁盘加载已生成的图集
+                service = ObjectService(base)
+                t = time.perf_counter()
+                service.get_knowledge_graph_data_ex(name, size, fmt, atlas=True)
+                cached = time.perf_counter() - t
+
+                files, file_bytes = requested(data["image"].values())
+                sheets, sheet_bytes = requested([sprite[0] for sprite in data["sprite"].values()])
+                print(f"{size}/{fmt:<6} {len(data['image']):6d} {files:6d} {file_bytes / 1024:8.0f} {sheets:7d} "
+                      f"{sheet_bytes / 1024:9.0f} {build * 1000:9.1f} {cached * 1000:10.1f}")
+        os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import random
+import tempfile
+import time
+
+from corpus import generate_corpus, quiet_logging
+from object_service import ObjectEntry, ObjectService
+
+
+class RescanObjectService(ObjectService):
+    # 对照组：每个请求都重新列举目录，等价于引入索引之前的行为
+    def _entry(self, path: str) -> ObjectEntry:
+        return ObjectEntry.scan(path)
+
+
+def measure(service: ObjectService, names, requests: int):
+    calls = [
+        service.get_knowledge_image_urls,
+        service.get_vectors,
+        service._get_images_and_subtitles,
+    ]
+    rnd = random.Random(1)
+    latencies = []
+    for _ in range(requests):
+        name = rnd.choice(names)
+        for call in calls:
+            arg = service.object_paths[name][0] if call == service._get_images_and_subtitles else name
+            t = time.perf_counter()
+            call(arg)
+            latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ObjectService catalog lookup vs per-request directory scans.")
+    parser.add_argument("--objects", type=int, default=2000)
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--images-per-segment", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = generate_corpus(tmp, args.objects, args.segments, args.images_per_segment)
+
+        t = time.perf_counter()
+        service = ObjectService(tmp)
+        print(f"catalog scan of {args.objects} objects: {(time.perf_counter() - t) * 1000:.1f} ms")
+
+        for label, svc in (("before (rescan)", RescanObjectService(tmp)), ("after (catalog)", service)):
+            p50, p99 = measure(svc, names, args.requests)
+            print(f"{label:>16}: p50 {p50 * 1e6:8.1f} us  p99 {p99 * 1e6:8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from corpus import SRC_DIRECTORY, add_corpus_arguments, generate_corpus_from_args, quiet_logging
+from harness import free_port, start_server
+
+# (标签, 第 i 个请求 -> (method, path, httpx 请求参数))
+Endpoint = Tuple[str, Callable[[int], Tuple[str, str, Dict[str, Any]]]]
+# src/static 下的媒体文件，用于 /static 的完整和 Range 请求
+MEDIA_FILE = "apple.jpg"
+# 检测端上报使用单独的频道，不影响其他接口的展示状态
+DETECTION_CHANNEL = "bench"
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def get(path: str, params: Dict = None, headers: Dict = None):
+    return "GET", path, {"params": params or {}, "headers": headers or {}}
+
+
+def detection_batch(names: List[str], i: int, size: int = 10):
+    # 每批 size 帧，每 5 批换一个物体；ts 由请求序号决定，去抖结果与并发和耗时无关
+    name = names[(i // 5) % len(names)]
+    return [{"object_name": name, "prob": 0.9, "ts": (i * size + k) * 0.04} for k in range(size)]
+
+
+def build_endpoints(names: List[str], asset: str) -> List[Endpoint]:
+    def pick(i: int) -> str:
+        return names[i % len(names)]
+
+    return [
+        ("/index", lambda i: get("/index")),
+        ("/assets/{item}", lambda i: get(f"/assets/{asset}")),
+        ("/object_names", lambda i: get("/object_names")),
+        ("/current_object_name", lambda i: get("/current_object_name")),
+        # 每次切换到不同的物体和概率，保证真正触发广播
+        ("/update_display", lambda i: get("/update_display", {"object_name": pick(i), "prob": (i % 1000) / 1000})),
+        ("/detections", lambda i: ("POST", "/detections", {"params": {"channel": DETECTION_CHANNEL},
+                                                          "json": detection_batch(names, i)})),
+        ("/vectors", lambda i: get("/vectors", {"object_name": pick(i)})),
+        ("/vectors?format=binary", lambda i: get("/vectors", {"object_name": pick(i), "format": "binary"})),
+        ("/pictures", lambda i: get("/pictures", {"object_name": pick(i)})),
+        ("/knowledge_graph", lambda i: get("/knowledge_graph", {"object_name": pick(i)})),
+        ("/knowledge_graph_ex", lambda i: get("/knowledge_graph_ex", {"object_name": pick(i)})),
+        ("/knowledge_graph_ex?atlas", lambda i: get("/knowledge_graph_ex", {"object_name": pick(i), "atlas": "true"})),
+        # 物体名、图谱节点和字幕都包含物体名，查询会命中多种文档
+        ("/search", lambda i: get("/search", {"q": pick(i)})),
+        ("/metrics", lambda i: get("/metrics")),
+        ("/static", lambda i: get(f"/static/{MEDIA_FILE}")),
+        # 模拟视频拖动：每次取不同位置的 64 KB
+        ("/static Range", lambda i: get(f"/static/{MEDIA_FILE}",
+                                        headers={"Range": f"bytes={(i % 8) * 65536}-{(i % 8) * 65536 + 65535}"})),
+    ]
+
+
+async def bench_endpoint(client: httpx.AsyncClient, endpoint: Endpoint, requests: int, concurrency: int):
+    _, make = endpoint
+    latencies = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, path, kwargs = make(i)
+            headers = {"Accept-Encoding": "gzip", **kwargs.pop("headers", {})}
+            t = time.perf_counter()
+            r = await client.request(method, path, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - t)
+            if r.status_code >= 400:
+                raise RuntimeError(f"{path} returned {r.status_code}: {r.text[:200]}")
+
+    t = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t
+    return percentile(latencies, 0.5), percentile(latencies, 0.99), requests / elapsed
+
+
+async def bench_fan_out(base_url: str, names: List[str], clients: int, rounds: int):
+    import websockets
+
+    ws_url = base_url.replace("http://", "ws://") + "/ws"
+    sockets = [await websockets.connect(ws_url, max_queue=None) for _ in range(clients)]
+    try:
+        for ws in sockets:
+            await ws.recv()
+        latencies = []
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            for r in range(rounds):
+                name = names[r % len(names)]
+                prob = r / (rounds + 1)
+                t = time.perf_counter()
+                await client.get("/update_display", params={"object_name": name, "prob": prob})
+
+                async def receive(ws):
+                    while True:
+                        msg = json.loads(await ws.recv())
+                        if msg["object_name"] == name and msg["prob"] == prob:
+                            return time.perf_counter() - t
+
+                latencies.extend(await asyncio.gather(*(receive(ws) for ws in sockets)))
+        return percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies)
+    finally:
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+
+
+async def bench_detection_stream(base_url: str, names: List[str], messages: int, min_dwell: float = 0.5):
+    # /ws/detections 没有回复：发送 messages 帧后再切换到一个哨兵物体，由 /ws 订阅端收到哨兵的时间计算吞吐
+    import websockets
+
+    ws_url = base_url.replace("http://", "ws://")
+    channel = f"{DETECTION_CHANNEL}-stream"
+    sentinel = names[-1]
+    async with websockets.connect(f"{ws_url}/ws?channel={channel}", max_queue=None) as subscriber, \
+            websockets.connect(f"{ws_url}/ws/detections?channel={channel}") as detector:
+        await subscriber.recv()
+        frames = [json.dumps({"object_name": names[(i // 25) % max(len(names) - 1, 1)], "prob": 0.9, "ts": i * 0.04})
+                  for i in range(messages)]
+        # 与上一帧间隔超过 min_dwell，两帧后一定切换
+        end = messages * 0.04 + min_dwell + 1
+        frames += [json.dumps({"object_name": sentinel, "prob": 0.9, "ts": end + k * (min_dwell + 1)}) for k in range(2)]
+        t = time.perf_counter()
+        for frame in frames:
+            await detector.send(frame)
+        while json.loads(await subscriber.recv())["object_name"] != sentinel:
+            pass
+        return len(frames) / (time.perf_counter() - t)
+
+
+async def run(client: httpx.AsyncClient, names: List[str], asset: str, args):
+    print(f"{'endpoint':<26} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+    for endpoint in build_endpoints(names, asset):
+        if args.only and endpoint[0] not in args.only:
+            continue
+        # 预热一轮，使各类缓存进入稳定状态
+        await bench_endpoint(client, endpoint, min(len(names), args.requests), args.concurrency)
+        p50, p99, rps = await bench_endpoint(client, endpoint, args.requests, args.concurrency)
+        print(f"{endpoint[0]:<26} {p50 * 1000:9.2f} {p99 * 1000:9.2f} {rps:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput for every endpoint in main.py.")
+    add_corpus_arguments(parser, objects=200)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("asgi", "socket"), default="asgi",
+                        help="asgi: in-process client without network; socket: real uvicorn server in a thread")
+    parser.add_argument("--url", help="benchmark an already running server instead (uses its own objects)")
+    parser.add_argument("--ws-clients", type=int, default=100, help="WebSocket fan-out clients (socket/url mode)")
+    parser.add_argument("--ws-rounds", type=int, default=20)
+    parser.add_argument("--detection-frames", type=int, default=5000,
+                        help="frames streamed over /ws/detections (socket/url mode)")
+    parser.add_argument("--only", nargs="*", help="endpoint labels to run, e.g. /pictures /knowledge_graph_ex")
+    args = parser.parse_args()
+
+    if args.url:
+        async def external():
+            async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+                names = sorted((await client.get("/object_names")).json())
+                asset = "index-CVbE00YX.js"
+                await run(client, names, asset, args)
+            if args.ws_clients:
+                print("ws fan-out p50 %.2f ms  p99 %.2f ms  max %.2f ms"
+                      % tuple(x * 1000 for x in await bench_fan_out(args.url, names, args.ws_clients, args.ws_rounds)))
+            if args.detection_frames:
+                rate = await bench_detection_stream(args.url, names, args.detection_frames)
+                print(f"/ws/detections: {rate:.0f} frames/s")
+        asyncio.run(external())
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = generate_corpus_from_args(tmp, args)
+        # main.py 使用相对 src 的路径
+        os.chdir(SRC_DIRECTORY)
+        import main as app_module
+        # 各模块导入时会把自己的 logger 设为 DEBUG，需要在导入之后调整
+        quiet_logging()
+        app_module.service.set_base_directory(tmp)
+        asset = sorted(os.listdir("static/assets"))[0]
+
+        if args.mode == "asgi":
+            async def in_process():
+                transport = httpx.ASGITransport(app=app_module.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                    await run(client, names, asset, args)
+            asyncio.run(in_process())
+            print("ws fan-out and /ws/detections need a real socket, run with --mode socket.")
+            return
+
+        port = free_port()
+        server = start_server(app_module.app, port)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            async def over_socket():
+                async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                    await run(client, names, asset, args)
+                if args.ws_clients:
+                    p50, p99, worst = await bench_fan_out(base_url, names, args.ws_clients, args.ws_rounds)
+                    print(f"ws fan-out ({args.ws_clients} clients): p50 {p50 * 1000:.2f} ms  "
+                          f"p99 {p99 * 1000:.2f} ms  max {worst * 1000:.2f} ms")
+                if args.detection_frames:
+                    rate = await bench_detection_stream(base_url, names, args.detection_frames,
+                                                        app_module.cfg.ingest_min_dwell)
+                    print(f"/ws/detections: {rate:.0f} frames/s")
+            asyncio.run(over_socket())
+        finally:
+            server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
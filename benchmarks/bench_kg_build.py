@@ -0,0 +1,134 @@
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from corpus import _make_kg, quiet_logging
+from knowledge_graph_service import build_graph
+
+
+class LegacyNode:
+    # 原 TreeNode 的布局：每个节点一个 __dict__
+    def __init__(self, _id, value, level, _type, branch):
+        self.id = _id
+        self.text = value
+        self.level = level
+        self.type = _type
+        self.branch = branch
+        self.children = []
+
+    def to_graph_node(self):
+        return {"id": self.id, "data": {"branch": self.branch, "text": self.text, "level": self.level,
+                                        "type": self.type}}
+
+
+class LegacyBuilder:
+    # 原 translate_tree + _tree_to_graph：先递归建树，再递归遍历生成 nodes/edges
+    def build(self, name, raw):
+        counter = [0]
+        root = LegacyNode(str(counter[0]), name, 0, "root", str(0))
+        self.branch_flag = 1
+        counter[0] += 1
+        self._translate_sub_tree(root, raw, 1, counter)
+        nodes = [root.to_graph_node()]
+        edges = []
+        self._tree_to_graph(root, nodes, edges)
+        return {"nodes": nodes, "edges": edges}
+
+    def _tree_to_graph(self, parent, nodes, edges):
+        for v in parent.children:
+            nodes.append(v.to_graph_node())
+            edges.append({"source": parent.id, "target": v.id})
+            self._tree_to_graph(v, nodes, edges)
+
+    def _translate_sub_tree(self, parent, children, level, counter):
+        if isinstance(children, str):
+            parent.children.append(LegacyNode(str(counter[0]), children.strip(), level, "leaf", str(self.branch_flag)))
+            counter[0] += 1
+        elif isinstance(children, list):
+            for i, v in enumerate(children):
+                if isinstance(v, str):
+                    parent.children.append(LegacyNode(str(counter[0]), v.strip(), level, "leaf", str(self.branch_flag)))
+                    counter[0] += 1
+                    continue
+                node = LegacyNode(str(counter[0]), str(i), level, "sub", str(self.branch_flag))
+                parent.children.append(node)
+                counter[0] += 1
+                self._translate_sub_tree(node, v, level + 1, counter)
+        elif isinstance(children, dict):
+            for k, v in children.items():
+                node = LegacyNode(str(counter[0]), k, level, "sub", str(self.branch_flag))
+                parent.children.append(node)
+                counter[0] += 1
+                self._translate_sub_tree(node, v, level + 1, counter)
+                if level == 1:
+                    self.branch_flag += 1
+
+
+def make_deep(depth: int, breadth: int):
+    # 深链：每层一个字典键和若干叶子，混合列表以覆盖各分支
+    raw = [f"leaf {i}" for i in range(breadth)]
+    for d in range(depth):
+        raw = {f"k{d}": raw, f"s{d}": f" leaf {d} "} if d % 2 else [raw, f"leaf {d}", {"x": "y"}]
+    return raw
+
+
+def make_random(rnd: random.Random, depth: int):
+    # 随机混合字符串、列表、字典以及不可处理的类型，用于核对输出一致
+    if depth <= 0 or rnd.random() < 0.2:
+        return rnd.choice([" text ", "leaf", 1, None]) if rnd.random() < 0.3 else f"t{rnd.random():.3f}"
+    if rnd.random() < 0.5:
+        return [make_random(rnd, depth - 1) for _ in range(rnd.randint(0, 4))]
+    return {f"k{i}": make_random(rnd, depth - 1) for i in range(rnd.randint(0, 4))}
+
+
+def measure(fn, *args, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge graph building: recursive TreeNode vs iterative builder.")
+    parser.add_argument("--depth", type=int, default=5, help="depth of the wide KG")
+    parser.add_argument("--breadth", type=int, default=8, help="breadth of the wide KG")
+    parser.add_argument("--deep", type=int, default=5000, help="depth of the deep KG")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    quiet_logging()
+
+    rnd = random.Random(0)
+    for _ in range(500):
+        raw = make_random(rnd, 6)
+        assert build_graph("物体", raw) == LegacyBuilder().build("物体", raw)
+
+    cases = [(f"wide {args.breadth}^{args.depth}", _make_kg(args.depth, args.breadth, "n")),
+             (f"deep {args.deep}", make_deep(args.deep, 4))]
+    print(f"{'kg':<16} {'nodes':>8} {'legacy ms':>10} {'legacy peak':>12} {'iterative ms':>13} {'iterative peak':>15}")
+    for label, raw in cases:
+        graph = build_graph("物体", raw)
+        new_time, new_peak = measure(build_graph, "物体", raw, repeat=args.repeat)
+        limit = sys.getrecursionlimit()
+        # 旧实现每层递归两次调用，深图需要提高递归上限才能运行
+        sys.setrecursionlimit(max(limit, args.deep * 4 + 1000))
+        try:
+            assert LegacyBuilder().build("物体", raw) == graph
+            old_time, old_peak = measure(LegacyBuilder().build, "物体", raw, repeat=args.repeat)
+            old = f"{old_time * 1000:10.1f} {old_peak / 1024 / 1024:10.1f}MB"
+        except RecursionError:
+            old = f"{'RecursionError':>23}"
+        finally:
+            sys.setrecursionlimit(limit)
+        print(f"{label:<16} {len(graph['nodes']):8d} {old} {new_time * 1000:13.1f} {new_peak / 1024 / 1024:13.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
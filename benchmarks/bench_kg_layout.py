@@ -0,0 +1,66 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from corpus import _make_kg, quiet_logging
+from graph_layout import radial_layout
+from knowledge_graph_service import GraphIndex, build_graph
+
+
+def python_layout(graph):
+    # 逐节点的纯 Python 实现，作为对照和正确性参考
+    nodes, edges = graph["nodes"], graph["edges"]
+    children = [[] for _ in nodes]
+    for edge in edges:
+        children[int(edge["source"])].append(int(edge["target"]))
+    weight = [0.0] * len(nodes)
+    for i in range(len(nodes) - 1, -1, -1):
+        weight[i] = sum(weight[c] for c in children[i]) if children[i] else 1.0
+    positions = [(0.0, 0.0)] * len(nodes)
+    stack = [(0, 0.0, 2 * math.pi)]
+    while stack:
+        i, start, span = stack.pop()
+        level = nodes[i]["data"]["level"]
+        angle = start + span / 2
+        positions[i] = (level * math.cos(angle), level * math.sin(angle))
+        offset = start
+        for c in children[i]:
+            child_span = span * weight[c] / weight[i]
+            stack.append((c, offset, child_span))
+            offset += child_span
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Radial KG layout time against node count.")
+    parser.add_argument("--breadth", type=int, default=6)
+    parser.add_argument("--max-depth", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    quiet_logging()
+
+    print(f"{'nodes':>9} {'python ms':>10} {'numpy ms':>9}")
+    for depth in range(2, args.max_depth + 1):
+        graph = build_graph("物体", _make_kg(depth, args.breadth, "n"))
+        index = GraphIndex(graph)
+        parents = np.zeros(len(graph["nodes"]), dtype=np.int64)
+        parents[1:] = [int(e["source"]) for e in graph["edges"]]
+        levels = np.array([n["data"]["level"] for n in graph["nodes"]], dtype=np.int64)
+
+        best_np = best_py = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            positions = radial_layout(parents, levels)
+            best_np = min(best_np, time.perf_counter() - t)
+            t = time.perf_counter()
+            reference = python_layout(graph)
+            best_py = min(best_py, time.perf_counter() - t)
+        assert np.allclose(positions, np.array(reference, dtype=np.float32), atol=1e-4)
+        assert np.allclose(index.get_layout(), positions)
+        print(f"{len(graph['nodes']):9d} {best_py * 1000:10.1f} {best_np * 1000:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
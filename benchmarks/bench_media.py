@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from corpus import quiet_logging
+from harness import free_port, start_server
+from media import MediaStaticFiles
+
+
+async def client(base: str, files, size: int, mode: str, chunk: int, deadline: float, stats):
+    rnd = random.Random()
+    async with httpx.AsyncClient(base_url=base, timeout=30) as http:
+        while time.perf_counter() < deadline:
+            file = rnd.choice(files)
+            headers = {}
+            if mode == "range":
+                # 模拟播放器拖动/循环：随机位置取一段
+                start = rnd.randrange(0, max(size - chunk, 1))
+                headers["Range"] = f"bytes={start}-{start + chunk - 1}"
+            t = time.perf_counter()
+            r = await http.get(f"/static/{file}", headers=headers)
+            stats["latencies"].append(time.perf_counter() - t)
+            stats["bytes"] += len(r.content)
+            assert r.status_code == (206 if mode == "range" else 200), r.status_code
+
+
+async def run(base: str, files, size: int, clients: int, mode: str, chunk: int, duration: float):
+    stats = {"latencies": [], "bytes": 0}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(base, files, size, mode, chunk, deadline, stats) for _ in range(clients)))
+    latencies = sorted(stats["latencies"])
+    return {
+        "requests/s": len(latencies) / duration,
+        "MB/s": stats["bytes"] / duration / 1e6,
+        "p50 ms": latencies[len(latencies) // 2] * 1000,
+        "p99 ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent video clients against the /static media route.")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--chunk-kb", type=int, default=512)
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        size = int(args.size_mb * 1e6)
+        files = []
+        for i in range(args.files):
+            files.append(f"{i}_clip.mp4")
+            with open(os.path.join(tmp, files[-1]), "wb") as file:
+                file.write(os.urandom(size))
+
+        port = free_port()
+        app = Starlette(routes=[Mount("/static", MediaStaticFiles(directory=tmp))])
+        server = start_server(app, port)
+        try:
+            for mode in ("range", "full"):
+                res = asyncio.run(run(f"http://127.0.0.1:{port}", files, size, args.clients, mode,
+                                      args.chunk_kb * 1024, args.duration))
+                print(f"{mode:>5}: " + "  ".join(f"{k} {v:.1f}" for k, v in res.items()))
+        finally:
+            server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import random
+import tempfile
+import time
+
+from corpus import add_corpus_arguments, generate_corpus_from_args, quiet_logging
+from object_service import ObjectService
+
+QUERIES = ["物体1", "字幕 3", "subtitle", "leaf 2", "object12 leaf", "物体7-1", "不存在", "体"]
+
+
+def scan_search(service: ObjectService, query: str):
+    # 对照组：逐个读取原始文件做子串匹配，等价于没有索引时的做法
+    needle = query.lower()
+    hits = set()
+    for name, paths in service.object_paths.items():
+        for path in paths:
+            entry = service._entry(path)
+            for lang, file in (("zh", entry.kg_file), ("en", entry.kg_en_file)):
+                if file:
+                    graph = service.knowledge_graph_service._build_graph_data(name, file)
+                    hits.update((path, "node", n["id"], lang) for n in graph["nodes"]
+                                if needle in n["data"]["text"].lower())
+            for lang, file in (("zh", entry.subtitle_zh_file), ("en", entry.subtitle_en_file)):
+                if file:
+                    hits.update((path, "segment", str(i), lang) for i, line in enumerate(service.read_all_lines(file))
+                                if needle in line.lower())
+    return hits
+
+
+def percentiles(latencies):
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inverted index search vs scanning the raw files.")
+    add_corpus_arguments(parser, objects=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_corpus_from_args(tmp, args)
+        t = time.perf_counter()
+        service = ObjectService(tmp)
+        index = service.search_index
+        print(f"scan + index of {args.objects} objects: {(time.perf_counter() - t) * 1000:.1f} ms, "
+              f"{len(index.docs)} documents, {len(index.postings)} terms, "
+              f"{sum(len(p) for p in index.postings.values())} postings")
+
+        # 查询都从词的开头开始，子串命中的文档都应当被索引找到（索引按词匹配，可能多出不连续命中的文档）
+        for query in QUERIES:
+            found = {(path, kind, key, lang) for _, path, kind, key, lang, _ in index.search(query, len(index.docs))}
+            missing = scan_search(service, query) - found
+            assert not missing, (query, sorted(missing)[:3])
+
+        rnd = random.Random(0)
+        latencies = []
+        for _ in range(args.requests):
+            query = rnd.choice(QUERIES)
+            t = time.perf_counter()
+            service.search(query, args.limit)
+            latencies.append(time.perf_counter() - t)
+        p50, p99 = percentiles(latencies)
+        print(f"{'index':>6}: p50 {p50 * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us")
+
+        latencies = []
+        for query in QUERIES:
+            t = time.perf_counter()
+            scan_search(service, query)
+            latencies.append(time.perf_counter() - t)
+        p50, p99 = percentiles(latencies)
+        print(f"{'scan':>6}: p50 {p50 * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us")
+
+
+if __name__ == '__main__':
+    main()
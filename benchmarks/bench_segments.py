@@ -0,0 +1,70 @@
+import argparse
+import random
+import re
+import time
+
+import corpus  # noqa: F401，设置 src 导入路径
+from object_service import group_segment_files
+
+
+def legacy_group(files, segment_count: int):
+    # 原 _get_images_and_subtitles 的做法：每个 segment 扫描全部文件
+    images, videos = dict(), dict()
+    for i in range(segment_count):
+        segment_id = str(i)
+        for f in files:
+            m = re.match(rf"^{segment_id}_\d+\.jpg$", f)
+            if m is not None:
+                images.setdefault(segment_id, []).append(m.string)
+            m = re.match(rf"^{segment_id}_.*\.mp4$", f)
+            if m is not None:
+                videos.setdefault(segment_id, []).append(m.string)
+    return images, videos
+
+
+def make_files(count: int, images_per_segment: int):
+    files = []
+    segment = 0
+    while len(files) < count:
+        files.extend(f"{segment}_{i}.jpg" for i in range(images_per_segment))
+        files.append(f"{segment}_clip.mp4")
+        segment += 1
+    # 不应被识别或容易误判的文件名
+    files[:0] = ["01_2.jpg", "1_2.jpg.mp4", "12_x.mp4", "a_1.jpg", "3_abc.jpg", "1_2.JPG", "Thumbs.db"]
+    random.Random(0).shuffle(files)
+    return files[:count], segment
+
+
+def timeit(fn, *args, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment bucketing: per-segment regex scans vs single pass.")
+    parser.add_argument("--images-per-segment", type=int, default=10)
+    parser.add_argument("--max-legacy-files", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'files':>7} {'segments':>9} {'legacy ms':>11} {'single pass ms':>15}")
+    for count in (10, 100, 1000, 10000):
+        files, segments = make_files(count, args.images_per_segment)
+        new = group_segment_files(files)
+        if count <= args.max_legacy_files:
+            old = legacy_group(files, segments)
+            # 旧实现只查询 0..segments-1，比较同一范围内的分组
+            ids = {str(i) for i in range(segments)}
+            assert old == tuple({k: v for k, v in b.items() if k in ids} for b in new), \
+                "bucketing differs from the legacy implementation"
+            legacy = f"{timeit(legacy_group, files, segments, repeat=1) * 1000:11.2f}"
+        else:
+            legacy = f"{'-':>11}"
+        print(f"{count:>7} {segments:>9} {legacy} {timeit(group_segment_files, files) * 1000:15.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import time
+
+from corpus import quiet_logging
+from utils import WebSocketsManager
+
+
+class FakeWebSocket:
+    # 模拟连接：记录每条消息从 publish 到发送完成的耗时，slow 连接的发送会长时间阻塞
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.latencies = []
+        self.closed = False
+
+    async def send_text(self, msg: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.latencies.append(time.perf_counter() - float(msg))
+
+    async def close(self):
+        self.closed = True
+
+
+class SerialWebSocketsManager:
+    # 对照组：原实现，持锁依次 await 每个连接
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.store = []
+
+    async def add(self, ws):
+        async with self.lock:
+            self.store.append(ws)
+
+    async def publish(self, msg: str):
+        async with self.lock:
+            for ws in self.store:
+                await ws.send_text(msg)
+
+
+async def run(manager, clients: int, slow: int, slow_delay: float, messages: int, interval: float):
+    sockets = [FakeWebSocket(slow_delay if i < slow else 0.0) for i in range(clients)]
+    for ws in sockets:
+        await manager.add(ws)
+
+    publish_durations = []
+    for _ in range(messages):
+        t = time.perf_counter()
+        await manager.publish(repr(t))
+        publish_durations.append(time.perf_counter() - t)
+        await asyncio.sleep(interval)
+    await asyncio.sleep(interval)
+
+    latencies = sorted(x for ws in sockets[slow:] for x in ws.latencies)
+    delivered = sum(len(ws.latencies) for ws in sockets[slow:])
+    evicted = sum(ws.closed for ws in sockets[:slow])
+    publish_durations.sort()
+    return {
+        "publish p50 ms": publish_durations[len(publish_durations) // 2] * 1000,
+        "publish max ms": publish_durations[-1] * 1000,
+        "fast p50 ms": latencies[len(latencies) // 2] * 1000 if latencies else float("nan"),
+        "fast p99 ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan"),
+        "delivered": f"{delivered}/{(clients - slow) * messages}",
+        "slow evicted": f"{evicted}/{slow}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket broadcast latency with a few stalled clients.")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=5)
+    parser.add_argument("--slow-delay", type=float, default=0.5)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--send-timeout", type=float, default=0.2)
+    parser.add_argument("--skip-serial", action="store_true", help="skip the serial baseline, which is slow")
+    args = parser.parse_args()
+    quiet_logging()
+
+    managers = [("queued", lambda: WebSocketsManager(send_timeout=args.send_timeout))]
+    if not args.skip_serial:
+        managers.append(("serial", SerialWebSocketsManager))
+    for label, factory in managers:
+        res = asyncio.run(run(factory(), args.clients, args.slow, args.slow_delay, args.messages, args.interval))
+        print(f"{label:>7}: " + "  ".join(f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}"
+                                          for k, v in res.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import ast
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from corpus import SRC_DIRECTORY, _make_kg
+
+LOG_METHODS = {"debug", "info", "warning", "error", "exception", "critical", "log"}
+
+
+def eager_calls(path: str):
+    # 找出日志参数在调用前就已经格式化的位置：f-string、"..." % x、"...".format(...)
+    with open(path, "r", encoding="utf-8") as file:
+        tree = ast.parse(file.read(), path)
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr not in LOG_METHODS or not isinstance(node.func.value, ast.Name):
+            continue
+        if not node.func.value.id.endswith("logger"):
+            continue
+        args = node.args[1:] if node.func.attr == "log" else node.args
+        if not args:
+            continue
+        msg = args[0]
+        if isinstance(msg, ast.JoinedStr):
+            yield node.lineno, "f-string"
+        elif isinstance(msg, ast.BinOp) and isinstance(msg.op, ast.Mod):
+            yield node.lineno, "% formatting"
+        elif isinstance(msg, ast.Call) and isinstance(msg.func, ast.Attribute) and msg.func.attr == "format":
+            yield node.lineno, "str.format"
+
+
+def check_sources(directory: str) -> int:
+    failures = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".py"):
+            continue
+        for lineno, kind in eager_calls(os.path.join(directory, name)):
+            print(f"{name}:{lineno}: log message built with {kind}, pass arguments instead")
+            failures += 1
+    return failures
+
+
+def count_serializations(level: int, kg_file: str) -> int:
+    # 统计构建图谱时 TreeNode 被序列化的次数（包括后台日志线程中的格式化）
+    import knowledge_graph_service
+    from log import logger_factory
+
+    calls = [0]
+    to_json = knowledge_graph_service.TreeNode.to_json
+
+    def counting_to_json(node):
+        calls[0] += 1
+        return to_json(node)
+
+    knowledge_graph_service.TreeNode.to_json = counting_to_json
+    try:
+        logging.getLogger(knowledge_graph_service.__name__).setLevel(level)
+        knowledge_graph_service.KnowledgeGraphService().translate_tree("物体", kg_file)
+        if level <= logging.DEBUG:
+            # 停止后台线程，确保队列中的日志都已格式化
+            logger_factory.stop()
+    finally:
+        knowledge_graph_service.TreeNode.to_json = to_json
+    return calls[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that disabled log levels never build their payloads.")
+    parser.add_argument("--src", default=SRC_DIRECTORY)
+    args = parser.parse_args()
+
+    failures = check_sources(args.src)
+
+    sys.path.insert(0, args.src)
+    from log import logger_factory
+    # 只关心参数是否被求值，日志内容丢弃
+    for handler in logger_factory.listener.handlers:
+        handler.setStream(open(os.devnull, "w"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kg_file = os.path.join(tmp, "kg.json")
+        with open(kg_file, "w", encoding="utf-8") as file:
+            json.dump(_make_kg(4, 5, "n"), file, ensure_ascii=False)
+        disabled = count_serializations(logging.INFO, kg_file)
+        print(f"TreeNode serializations with DEBUG disabled: {disabled}")
+        if disabled:
+            failures += 1
+        # 对照：开启 DEBUG 时应当被序列化，否则说明本检查没有生效
+        enabled = count_serializations(logging.DEBUG, kg_file)
+        print(f"TreeNode serializations with DEBUG enabled: {enabled}")
+        if not enabled:
+            failures += 1
+
+    print("ok" if failures == 0 else f"{failures} problem(s) found")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from corpus import generate_corpus, quiet_logging
+from object_service import ObjectService
+from vector_store import BINARY_HEADER, cache_path, select_rows, to_binary
+
+# 边界值：前导零和 float32 无法精确表示的 10 位整数
+EDGE_ROW = "0000000001 1111111111 1000000000 0000000000"
+
+
+def decode(data: bytes):
+    # 按接口文档解析二进制响应，还原为与源文件相同的位串文本
+    rows, strings, digits = BINARY_HEADER.unpack_from(data)
+    bits = np.frombuffer(data, dtype=np.uint8, offset=BINARY_HEADER.size)
+    if bits.size != rows * strings * digits:
+        raise ValueError(f"payload has {bits.size} bytes, header says {rows}x{strings}x{digits}.")
+    text = (bits + ord("0")).tobytes().decode("ascii")
+    tokens = [text[i:i + digits] for i in range(0, len(text), digits)]
+    return [" ".join(tokens[r * strings:(r + 1) * strings]) for r in range(rows)]
+
+
+def check_object(service, name: str, stride: int) -> int:
+    failures = 0
+    expected = [line.split() for line in service.get_vectors(name).splitlines() if line.strip()]
+    array = service.get_vector_array(name)
+    for rows, source in ((array, expected), (select_rows(array, 1, None, stride), expected[1::stride])):
+        decoded = [line.split() for line in decode(to_binary(rows))]
+        if decoded != source:
+            print(f"{name}: binary output differs from the text file ({len(decoded)} vs {len(source)} rows)")
+            failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that binary vectors decode back to the exact source text.")
+    parser.add_argument("--objects", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--cols", type=int, default=64)
+    parser.add_argument("--stride", type=int, default=3)
+    args = parser.parse_args()
+
+    quiet_logging()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        names = generate_corpus(tmp, args.objects, 2, 1, vector_rows=args.rows, vector_cols=args.cols)
+        service = ObjectService(tmp)
+        vector_file = service._entry(service.object_paths[names[0]][0]).vector_file
+        with open(vector_file, "a", encoding="utf-8") as file:
+            file.write("\n" + " ".join(EDGE_ROW.split() * (args.cols // 4 + 1))[:args.cols * 11 - 1])
+
+        for name in names:
+            failures += check_object(service, name, args.stride)
+        # 第二次从 .cache 中的 mmap 缓存读取
+        service = ObjectService(tmp)
+        for name in names:
+            failures += check_object(service, name, args.stride)
+
+        # 旧版本写入的 float32 缓存应当被重新转换
+        output = cache_path(vector_file)
+        np.save(output, np.zeros((1, 1), dtype=np.float32))
+        os.utime(output, ns=(os.stat(vector_file).st_mtime_ns + 1,) * 2)
+        service = ObjectService(tmp)
+        failures += check_object(service, names[0], args.stride)
+
+    print("ok" if failures == 0 else f"{failures} problem(s) found")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+
+# benchmarks 以 src 下的模块为被测对象，与 main.py 一样使用平铺导入
+SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, os.path.normpath(SRC_DIRECTORY))
+
+
+def quiet_logging():
+    # log.py 将根 logger 设为 DEBUG，压测时只保留错误输出
+    from log import logger_factory
+    logging.getLogger().setLevel(logging.ERROR)
+    logger_factory.set_level("ERROR")
+
+
+def _make_kg(depth: int, breadth: int, prefix: str):
+    if depth <= 1:
+        return [f"{prefix} leaf {i}" for i in range(breadth)]
+    return {f"{prefix}-{i}": _make_kg(depth - 1, breadth, f"{prefix}-{i}") for i in range(breadth)}
+
+
+def generate_corpus(base_directory: str, objects: int = 100, segments: int = 10, images_per_segment: int = 4,
+                    squares: int = 20, kg_depth: int = 3, kg_breadth: int = 4, vector_rows: int = 1,
+                    vector_cols: int = 64, seed: int = 0):
+    # 生成与真实素材同样命名规则的物体目录，图片和视频为空文件
+    rnd = random.Random(seed)
+    os.makedirs(base_directory, exist_ok=True)
+    names = []
+    for o in range(objects):
+        name = f"物体{o}"
+        object_path = os.path.join(base_directory, f"{name}_{o:06d}")
+        images_path = os.path.join(object_path, "images")
+        square_path = os.path.join(object_path, "images_square")
+        os.makedirs(images_path, exist_ok=True)
+        os.makedirs(square_path, exist_ok=True)
+
+        kg = _make_kg(kg_depth, kg_breadth, name)
+        with open(os.path.join(object_path, f"{name}_{o}_kg.json"), "w", encoding="utf-8") as file:
+            json.dump(kg, file, ensure_ascii=False)
+        with open(os.path.join(object_path, f"{name}_{o}_kg_en.json"), "w", encoding="utf-8") as file:
+            json.dump(_make_kg(kg_depth, kg_breadth, f"object{o}"), file)
+        with open(os.path.join(object_path, f"{name}_{o}_structure-lang.txt"), "w", encoding="utf-8") as file:
+            file.write("\n".join(f"{name} 字幕 {s}" for s in range(segments)))
+        with open(os.path.join(object_path, f"{name}_{o}_structure-lang_en.txt"), "w", encoding="utf-8") as file:
+            file.write("\n".join(f"object {o} subtitle {s}" for s in range(segments)))
+        with open(os.path.join(object_path, f"{name}_{o}_vector.txt"), "w", encoding="utf-8") as file:
+            # 与现有素材一致：空格分隔的 10 位 0/1 串，每行一个向量
+            file.write("\n".join(" ".join("".join(rnd.choice("01") for _ in range(10)) for _ in range(vector_cols))
+                                 for _ in range(vector_rows)))
+
+        for s in range(segments):
+            for i in range(images_per_segment):
+                open(os.path.join(images_path, f"{s}_{i}.jpg"), "wb").close()
+            open(os.path.join(images_path, f"{s}_clip.mp4"), "wb").close()
+        for i in range(squares):
+            open(os.path.join(square_path, f"{i // images_per_segment}_{i % images_per_segment}.jpg"), "wb").close()
+        names.append(name)
+    return names
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser, objects: int = 100):
+    parser.add_argument("--objects", type=int, default=objects)
+    parser.add_argument("--segments", type=int, default=10)
+    parser.add_argument("--images-per-segment", type=int, default=4)
+    parser.add_argument("--squares", type=int, default=20)
+    parser.add_argument("--kg-depth", type=int, default=3)
+    parser.add_argument("--kg-breadth", type=int, default=4)
+    parser.add_argument("--vector-rows", type=int, default=1)
+    parser.add_argument("--vector-cols", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generate_corpus_from_args(base_directory: str, args: argparse.Namespace):
+    return generate_corpus(base_directory, args.objects, args.segments, args.images_per_segment, args.squares,
+                           args.kg_depth, args.kg_breadth, args.vector_rows, args.vector_cols, args.seed)
+
+
+if __name__ == '__main__':
+    cli = argparse.ArgumentParser(description="Generate a synthetic static/objects tree.")
+    cli.add_argument("output", help="directory to write the object directories into")
+    add_corpus_arguments(cli)
+    cli_args = cli.parse_args()
+    print(f"generated {len(generate_corpus_from_args(cli_args.output, cli_args))} objects in {cli_args.output}.")
@@ -1,48 +1,143 @@
+import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
 from PIL import Image
 
+# images_square/<file>.jpg 保持原来的 256 中心裁剪，供旧版前端使用；
+# images_square/<size>/<file>.jpg|.webp 为缩放后的多尺寸版本
+LEGACY_SIZE = 256
+DEFAULT_SIZES = (128, 256, 512)
 
-def rm_recursive(path):
-    if os.path.isdir(path):
-        for f in os.listdir(path):
-            p = os.path.join(path, f)
-            if os.path.isdir(p):
-                rm_recursive(p)
-            else:
-                os.remove(p)
-        os.rmdir(path)
-    else:
-        os.remove(path)
 
+def is_up_to_date(source: str, outputs: List[str]) -> bool:
+    mtime = os.stat(source).st_mtime_ns
+    for output in outputs:
+        try:
+            if os.stat(output).st_mtime_ns < mtime:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
 
-def main():
-    objects_dir = "src/static/objects"
-    for object_dir in os.listdir(objects_dir):
-        object_dir_abs = os.path.join(objects_dir, object_dir)
-        image_dir = os.path.join(object_dir_abs, "images")
 
-        output_dir = os.path.join(object_dir_abs, "images_square")
-        if os.path.exists(output_dir):
-            rm_recursive(output_dir)
-        os.mkdir(output_dir)
+def central_crop(img: Image.Image, size: int) -> Image.Image:
+    width, height = img.size
+    new_size = min(width, height, size)
+    left = (width - new_size) / 2
+    top = (height - new_size) / 2
+    return img.crop((left, top, left + new_size, top + new_size))
+
+
+def square_thumbnail(img: Image.Image, size: int) -> Image.Image:
+    # 取中心最大正方形后缩放，原图较小时不放大
+    width, height = img.size
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 2
+    square = img.crop((left, top, left + side, top + side))
+    if side > size:
+        square = square.resize((size, size), Image.LANCZOS)
+    return square
+
+
+def outputs_of(image_path: str, output_dir: str, sizes: Tuple[int, ...], webp: bool) -> List[str]:
+    file = os.path.basename(image_path)
+    stem = os.path.splitext(file)[0]
+    outputs = [os.path.join(output_dir, file)]
+    for size in sizes:
+        outputs.append(os.path.join(output_dir, str(size), file))
+        if webp:
+            outputs.append(os.path.join(output_dir, str(size), f"{stem}.webp"))
+    return outputs
+
+
+def process_image(task: Tuple[str, str, Tuple[int, ...], bool, bool]) -> Tuple[str, bool, str]:
+    image_path, output_dir, sizes, webp, force = task
+    outputs = outputs_of(image_path, output_dir, sizes, webp)
+    try:
+        if not force and is_up_to_date(image_path, outputs):
+            return image_path, False, ""
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            central_crop(img, LEGACY_SIZE).save(outputs[0])
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            for size in sizes:
+                size_dir = os.path.join(output_dir, str(size))
+                os.makedirs(size_dir, exist_ok=True)
+                thumbnail = square_thumbnail(img, size)
+                thumbnail.save(os.path.join(size_dir, os.path.basename(image_path)), quality=85)
+                if webp:
+                    thumbnail.save(os.path.join(size_dir, f"{stem}.webp"), quality=80, method=4)
+        return image_path, True, ""
+    except Exception as ex:
+        return image_path, False, repr(ex)
+
 
+def remove_orphans(output_dir: str, sources: set) -> int:
+    # 删除源图已不存在的输出文件
+    removed = 0
+    for root, _, files in os.walk(output_dir):
+        for file in files:
+            stem = os.path.splitext(file)[0]
+            if stem not in sources:
+                os.remove(os.path.join(root, file))
+                removed += 1
+    return removed
+
+
+def collect_tasks(objects_dir: str, sizes: Tuple[int, ...], webp: bool, force: bool):
+    tasks = []
+    removed = 0
+    for object_dir in os.listdir(objects_dir):
+        image_dir = os.path.join(objects_dir, object_dir, "images")
+        if not os.path.isdir(image_dir):
+            continue
+        output_dir = os.path.join(objects_dir, object_dir, "images_square")
+        os.makedirs(output_dir, exist_ok=True)
+
+        sources = set()
         for file in os.listdir(image_dir):
             if not file.endswith(".jpg"):
                 continue
-            image_path = os.path.join(image_dir, file)
-            output_path = os.path.join(output_dir, file)
-            with Image.open(image_path) as img:
-                width, height = img.size
-                new_size = min(width, height, 256)
-                new_width = new_height = new_size
-
-                left = (width - new_width) / 2
-                top = (height - new_height) / 2
-                right = (width + new_width) / 2
-                bottom = (height + new_height) / 2
-
-                new_img = img.crop((left, top, right, bottom))
-                new_img.save(output_path)
+            sources.add(os.path.splitext(file)[0])
+            tasks.append((os.path.join(image_dir, file), output_dir, sizes, webp, force))
+        removed += remove_orphans(output_dir, sources)
+    return tasks, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate square thumbnails for knowledge graph images.")
+    parser.add_argument("--objects-dir", default="src/static/objects")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma separated square sizes (default: %(default)s)")
+    parser.add_argument("--no-webp", action="store_true", help="do not write WebP variants")
+    parser.add_argument("--force", action="store_true", help="regenerate up-to-date thumbnails too")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    sizes = tuple(sorted(int(s) for s in args.sizes.split(",") if s.strip()))
+    start = time.perf_counter()
+    tasks, removed = collect_tasks(args.objects_dir, sizes, not args.no_webp, args.force)
+
+    processed = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for image_path, done, error in executor.map(process_image, tasks, chunksize=32):
+            if error:
+                failed += 1
+                print(f"failed: {image_path}: {error}")
+            elif done:
+                processed += 1
+            else:
+                skipped += 1
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"images: {len(tasks)}, processed: {processed}, up to date: {skipped}, failed: {failed}, "
+          f"orphans removed: {removed}")
+    print(f"elapsed: {elapsed:.2f} s, throughput: {rate:.1f} images/s with {args.workers} workers")
 
 
 if __name__ == '__main__':
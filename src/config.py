@@ -1,4 +1,6 @@
 import json
+import os
+import tempfile
 from typing import Dict
 
 
@@ -6,9 +8,61 @@ class Config:
     def __init__(self):
         self.static_objects_directory = "objects"
         self.log_level = "INFO"
+        # 高频日志按调用位置限流：每 log_rate_limit_interval 秒最多 log_rate_limit_burst 条，interval 为 0 时不限流
+        self.log_rate_limit_interval = 10.0
+        self.log_rate_limit_burst = 5
+        self.kg_cache_max_entries = 256
+        self.kg_cache_max_bytes = 64 * 1024 * 1024
+        self.ws_queue_size = 4
+        self.ws_send_timeout = 5.0
+        self.ws_ping_interval = 20.0
+        self.ws_ping_timeout = 20.0
+        # uvicorn worker 数量；大于 1 时展示状态需要跨进程同步
+        self.workers = 1
+        # local：单进程内存；unix：同一主机多进程，通过 Unix socket 广播
+        self.display_backend = "local"
+        self.display_socket_directory = os.path.join(tempfile.gettempdir(), "data_visualization")
+        # /static 下文件的 Cache-Control max-age（秒）
+        self.media_max_age = 3600
+        # 检测端上报（/detections、/ws/detections）的去抖参数：切换前的最短停留时间（秒）、最低概率、最小概率变化
+        self.ingest_min_dwell = 0.5
+        self.ingest_min_prob = 0.5
+        self.ingest_min_prob_delta = 0.05
+        # 检查 static_objects_directory 变化并增量重新加载的间隔（秒），安装了 watchfiles 时改为监听文件系统事件；0 为关闭
+        self.reload_watch_interval = 5.0
+        # 按需性能分析（?profile=1、/admin/profile）；关闭时不接入任何代码。结果写入 profiling_directory
+        self.profiling_enabled = False
+        self.profiling_directory = "profiles"
+        # /admin/profile 的采样间隔（秒）
+        self.profiling_sample_interval = 0.005
 
     def parse(self, file: str):
         cfg: Dict = json.load(open(file))
         self.static_objects_directory = cfg.get("static_objects_directory")
         self.log_level = cfg.get("log_level")
+        self.log_rate_limit_interval = cfg.get("log_rate_limit_interval", self.log_rate_limit_interval)
+        self.log_rate_limit_burst = cfg.get("log_rate_limit_burst", self.log_rate_limit_burst)
+        self.kg_cache_max_entries = cfg.get("kg_cache_max_entries", self.kg_cache_max_entries)
+        self.kg_cache_max_bytes = cfg.get("kg_cache_max_bytes", self.kg_cache_max_bytes)
+        self.ws_queue_size = cfg.get("ws_queue_size", self.ws_queue_size)
+        self.ws_send_timeout = cfg.get("ws_send_timeout", self.ws_send_timeout)
+        self.ws_ping_interval = cfg.get("ws_ping_interval", self.ws_ping_interval)
+        self.ws_ping_timeout = cfg.get("ws_ping_timeout", self.ws_ping_timeout)
+        self.workers = cfg.get("workers", self.workers)
+        self.display_backend = cfg.get("display_backend", self.display_backend)
+        self.display_socket_directory = cfg.get("display_socket_directory", self.display_socket_directory)
+        self.media_max_age = cfg.get("media_max_age", self.media_max_age)
+        self.ingest_min_dwell = cfg.get("ingest_min_dwell", self.ingest_min_dwell)
+        self.ingest_min_prob = cfg.get("ingest_min_prob", self.ingest_min_prob)
+        self.ingest_min_prob_delta = cfg.get("ingest_min_prob_delta", self.ingest_min_prob_delta)
+        self.reload_watch_interval = cfg.get("reload_watch_interval", self.reload_watch_interval)
+        self.profiling_enabled = cfg.get("profiling_enabled", self.profiling_enabled)
+        self.profiling_directory = cfg.get("profiling_directory", self.profiling_directory)
+        self.profiling_sample_interval = cfg.get("profiling_sample_interval", self.profiling_sample_interval)
         return self
+
+    def get_display_backend(self):
+        # 多 worker 时内存状态无法共享，自动改用 unix
+        if self.workers > 1 and self.display_backend == "local":
+            return "unix"
+        return self.display_backend
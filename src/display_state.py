@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from log import logger_factory
+
+logger = logger_factory.get_logger(__name__, rate_limited=True)
+
+# 多个展厅共用一个服务时，每个展厅（频道）有各自的当前展示物体；不指定频道时使用 default
+DEFAULT_CHANNEL = "default"
+# 频道名也用于 unix backend 的状态文件名，只允许字母、数字、下划线和连字符
+CHANNEL_PATTERN = re.compile(r"[0-9A-Za-z_-]{1,64}")
+STATE_PREFIX = "state-"
+# 对端 worker 接收缓冲区满时，重新发送的间隔（秒）
+RETRY_INTERVAL = 0.05
+
+# (频道, 物体名, 概率)
+OnChange = Callable[[str, str, float], Awaitable[None]]
+
+
+def valid_channel(channel: str) -> bool:
+    return CHANNEL_PATTERN.fullmatch(channel) is not None
+
+
+class DisplayState:
+    def __init__(self):
+        self.object_name = "nothing"
+        self.prob = 0
+        self.seq = 0
+        # 已推送给本进程连接的最新序号，状态可能先从共享文件同步，推送仍需补发
+        self.notified_seq = 0
+        # unix backend：最近一次读取的状态文件 mtime
+        self.mtime_ns = 0
+
+
+class LocalDisplayBackend:
+    # 单进程：各频道的当前展示状态只保存在内存中
+    def __init__(self):
+        self.states: Dict[str, DisplayState] = dict()
+        # 更新序号只增不减，不使用墙上时间，系统时间回拨后的更新不会被当作旧状态丢弃
+        self.counter = itertools.count(1)
+        self.on_change: Optional[OnChange] = None
+
+    async def start(self, on_change: OnChange):
+        self.on_change = on_change
+
+    async def stop(self):
+        self.on_change = None
+
+    def current(self, channel: str = DEFAULT_CHANNEL) -> Tuple[str, float]:
+        # 只读不创建，没有更新过的频道为 nothing
+        state = self.states.get(channel)
+        if state is None:
+            return "nothing", 0
+        return state.object_name, state.prob
+
+    async def update(self, object_name: str, prob: float, channel: str = DEFAULT_CHANNEL):
+        await self._apply(channel, next(self.counter), object_name, prob)
+
+    def _state(self, channel: str) -> DisplayState:
+        state = self.states.get(channel)
+        if state is None:
+            state = self.states[channel] = DisplayState()
+        return state
+
+    async def _apply(self, channel: str, seq: int, object_name: str, prob: float):
+        state = self._state(channel)
+        if seq < state.seq:
+            return
+        state.seq = seq
+        state.object_name = object_name
+        state.prob = prob
+        if seq > state.notified_seq:
+            state.notified_seq = seq
+            if self.on_change is not None:
+                await self.on_change(channel, object_name, prob)
+
+
+class UnixSocketDisplayBackend(LocalDisplayBackend):
+    # 多 worker：每个频道的状态写入共享目录下的 state-<频道>.json，每个 worker 绑定一个 Unix datagram socket，
+    # 更新时向目录下所有 socket 广播，各 worker 再推送给自己订阅了该频道的 WebSocket 连接
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"worker-{os.getpid()}.sock")
+        self.sock: Optional[socket.socket] = None
+        # 对端 socket -> 频道 -> 尚未送达的最新消息；接收方按 seq 丢弃旧状态，只需保留每个频道的最新一条
+        self.backlog: Dict[str, Dict[str, bytes]] = dict()
+        self.retry: Optional[asyncio.TimerHandle] = None
+        # 收到广播后应用状态的任务，保持引用避免被回收
+        self.tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def reset(cls, directory: str):
+        # 主进程启动 worker 前调用，清除上一次运行遗留的状态和 socket
+        os.makedirs(directory, exist_ok=True)
+        for file in os.listdir(directory):
+            if file.startswith(STATE_PREFIX) or file.endswith(".sock"):
+                try:
+                    os.remove(os.path.join(directory, file))
+                except OSError as ex:
+                    logger.warning("can not remove %s: %s.", file, ex)
+
+    async def start(self, on_change: OnChange):
+        await super().start(on_change)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+        for file in os.listdir(self.directory):
+            if file.startswith(STATE_PREFIX) and file.endswith(".json"):
+                self._reload_state(file[len(STATE_PREFIX):-len(".json")])
+        logger.info("display backend listening on %s.", self.path)
+
+    async def stop(self):
+        await super().stop()
+        if self.retry is not None:
+            self.retry.cancel()
+            self.retry = None
+        self.backlog.clear()
+        for task in list(self.tasks):
+            task.cancel()
+        if self.sock is not None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def state_file(self, channel: str) -> str:
+        return os.path.join(self.directory, f"{STATE_PREFIX}{channel}.json")
+
+    def current(self, channel: str = DEFAULT_CHANNEL) -> Tuple[str, float]:
+        # 以共享文件为准，避免丢失的广播导致各 worker 返回不一致的结果
+        self._reload_state(channel)
+        return super().current(channel)
+
+    async def update(self, object_name: str, prob: float, channel: str = DEFAULT_CHANNEL):
+        # 跨进程的序号：monotonic_ns 在 Linux 上是系统范围的单调时钟，再与共享文件中的最新序号比较，保证递增
+        self._reload_state(channel)
+        seq = max(self._state(channel).seq + 1, time.monotonic_ns())
+        data = json.dumps({"channel": channel, "seq": seq, "object_name": object_name, "prob": prob},
+                          ensure_ascii=False).encode("utf-8")
+        self._write_state(channel, data)
+        self._broadcast(channel, data)
+        await self._apply(channel, seq, object_name, prob)
+
+    def _write_state(self, channel: str, data: bytes):
+        # 每个频道一个文件，不同 worker 同时更新不同频道时不会互相覆盖
+        path = self.state_file(channel)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(data)
+        os.replace(tmp, path)
+
+    def _reload_state(self, channel: str):
+        path = self.state_file(channel)
+        state = self.states.get(channel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            if state is not None and mtime_ns == state.mtime_ns:
+                return
+            with open(path, "rb") as file:
+                data = json.loads(file.read())
+        except (OSError, ValueError):
+            return
+        state = self._state(channel)
+        state.mtime_ns = mtime_ns
+        if data["seq"] > state.seq:
+            # 只同步状态，推送由广播负责
+            state.seq = data["seq"]
+            state.object_name = data["object_name"]
+            state.prob = data["prob"]
+
+    def _broadcast(self, channel: str, data: bytes):
+        for file in os.listdir(self.directory):
+            path = os.path.join(self.directory, file)
+            if not file.endswith(".sock") or path == self.path:
+                continue
+            backlog = self.backlog.get(path)
+            if backlog is not None:
+                # 该 worker 还有未送达的消息，等待重试时一起发送
+                backlog[channel] = data
+                continue
+            self._send(path, channel, data)
+
+    def _send(self, path: str, channel: str, data: bytes):
+        try:
+            self.sock.sendto(data, path)
+        except BlockingIOError:
+            # 对端接收缓冲区已满（例如事件循环被阻塞），稍后重试，不能丢弃，否则该 worker 的展示端收不到更新
+            logger.debug("display socket %s is full, retry later.", path)
+            self.backlog.setdefault(path, dict())[channel] = data
+            if self.retry is None:
+                self.retry = asyncio.get_running_loop().call_later(RETRY_INTERVAL, self._retry)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # worker 已退出，清理遗留的 socket 文件
+            logger.debug("remove stale display socket %s.", path)
+            self.backlog.pop(path, None)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        except OSError as ex:
+            logger.warning("display broadcast to %s failed: %s.", path, ex)
+
+    def _retry(self):
+        self.retry = None
+        if self.sock is None:
+            return
+        for path in list(self.backlog):
+            for channel, data in self.backlog.pop(path).items():
+                if path in self.backlog:
+                    # 本轮已经发送失败，其余消息继续等待
+                    self.backlog[path][channel] = data
+                else:
+                    self._send(path, channel, data)
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("display update failed: %r.", task.exception())
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                state = json.loads(data)
+            except ValueError as ex:
+                logger.warning("invalid display message: %s.", ex)
+                continue
+            task = asyncio.ensure_future(self._apply(state.get("channel", DEFAULT_CHANNEL), state["seq"],
+                                                     state["object_name"], state["prob"]))
+            self.tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+
+
+def create_display_backend(name: str, directory: str):
+    if name == "unix":
+        return UnixSocketDisplayBackend(directory)
+    if name != "local":
+        logger.warning("unknown display backend %s, fall back to local.", name)
+    return LocalDisplayBackend()
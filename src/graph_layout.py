@@ -0,0 +1,48 @@
+import math
+
+import numpy as np
+
+# 相邻两层之间的半径间隔，前端按需缩放
+RING_SPACING = 1.0
+
+
+def radial_layout(parents: np.ndarray, levels: np.ndarray, ring_spacing: float = RING_SPACING) -> np.ndarray:
+    # 径向树布局：根在原点，第 n 层在半径 n 的圆上，每个节点按子树叶子数分得父节点的角度区间。
+    # 要求节点按先序排列（build_graph 的输出），这样同一层中兄弟节点连续且父节点有序，每层只需一次向量运算。
+    count = len(parents)
+    positions = np.zeros((count, 2), dtype=np.float32)
+    if count <= 1:
+        return positions
+
+    max_level = int(levels.max())
+    by_level = [np.flatnonzero(levels == level) for level in range(max_level + 1)]
+
+    # 子树叶子数，自底向上逐层累加
+    weight = np.zeros(count, dtype=np.float64)
+    has_children = np.zeros(count, dtype=bool)
+    has_children[parents[1:]] = True
+    weight[~has_children] = 1.0
+    for level in range(max_level, 0, -1):
+        nodes = by_level[level]
+        np.add.at(weight, parents[nodes], weight[nodes])
+
+    start = np.zeros(count, dtype=np.float64)
+    span = np.zeros(count, dtype=np.float64)
+    span[0] = 2 * math.pi
+    for level in range(1, max_level + 1):
+        nodes = by_level[level]
+        node_parents = parents[nodes]
+        w = weight[nodes]
+        # 同一父节点下，排在前面的兄弟节点的叶子数之和
+        preceding = np.cumsum(w) - w
+        first = np.searchsorted(node_parents, node_parents, side="left")
+        offset = preceding - preceding[first]
+        scale = span[node_parents] / weight[node_parents]
+        start[nodes] = start[node_parents] + offset * scale
+        span[nodes] = w * scale
+
+    angle = start + span / 2
+    radius = levels * ring_spacing
+    positions[:, 0] = radius * np.cos(angle)
+    positions[:, 1] = radius * np.sin(angle)
+    return positions
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该长度的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+
+def json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    # 默认压缩级别偏向速度，构建时预压缩可以传入更高的级别
+    if encoding == "br":
+        return brotli.compress(body, quality=5 if level is None else level)
+    return gzip.compress(body, compresslevel=6 if level is None else level)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    res = dict()
+    for part in header.split(","):
+        items = part.strip().split(";")
+        coding = items[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in items[1:]:
+            k, _, v = param.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        res[coding] = q
+    return res
+
+
+def choose_encoding(header: Optional[str], available: Tuple[str, ...]) -> str:
+    # 按 q 值选择，q 相同时按 available 的顺序优先
+    if not header:
+        return "identity"
+    accepted = parse_accept_encoding(header)
+    best, best_q = "identity", 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def parse_etags(header: Optional[str]) -> List[str]:
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+
+class EncodedPayload:
+    # 预先编码好的响应体，压缩版本按需生成后缓存
+    def __init__(self, body: bytes, media_type: str = "application/json", cache_control: str = "no-cache",
+                 compressible: bool = True):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.compressible = compressible
+        self.digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.lock = threading.Lock()
+        self.variants: Dict[str, bytes] = {"identity": body}
+
+    @classmethod
+    def from_obj(cls, obj: Any):
+        return cls(json_dumps(obj))
+
+    def etag(self, encoding: str) -> str:
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+    def available_encodings(self) -> Tuple[str, ...]:
+        if not self.compressible or len(self.body) < MIN_COMPRESS_SIZE:
+            return ()
+        # 已有预压缩版本（例如构建时生成的 .br 文件）时即使没有安装 brotli 也可以使用
+        if brotli is not None or "br" in self.variants:
+            return "br", "gzip"
+        return ("gzip",)
+
+    def set_variant(self, encoding: str, body: bytes):
+        with self.lock:
+            self.variants[encoding] = body
+
+    def variant(self, encoding: str) -> bytes:
+        body = self.variants.get(encoding)
+        if body is not None:
+            return body
+        with self.lock:
+            body = self.variants.get(encoding)
+            if body is None:
+                body = compress(self.body, encoding)
+                self.variants[encoding] = body
+        return body
+
+    def matches(self, request: Request) -> bool:
+        tags = parse_etags(request.headers.get("if-none-match"))
+        if not tags:
+            return False
+        if "*" in tags:
+            return True
+        own = {self.etag("identity"), self.etag("gzip"), self.etag("br")}
+        return any(tag in own for tag in tags)
+
+    def to_response(self, request: Request) -> Response:
+        encoding = choose_encoding(request.headers.get("accept-encoding"), self.available_encodings())
+        headers = {
+            "ETag": self.etag(encoding),
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self.matches(request):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variant(encoding), media_type=self.media_type, headers=headers)
+
+
+class PayloadCache:
+    # (endpoint, object) -> (版本, EncodedPayload)，版本变化时重新生成
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, Tuple[Hashable, EncodedPayload]]" = OrderedDict()
+        # 正在生成的 (key, 版本)，并发的相同请求等待同一次生成的结果
+        self.in_flight: Dict[Tuple[Hashable, Hashable], Future] = dict()
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> EncodedPayload:
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and item[0] == version:
+                self.entries.move_to_end(key)
+                return item[1]
+            flight = self.in_flight.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self.in_flight[(key, version)] = flight
+
+        if not leader:
+            return flight.result()
+
+        try:
+            payload = EncodedPayload.from_obj(build())
+        except BaseException as ex:
+            with self.lock:
+                del self.in_flight[(key, version)]
+            flight.set_exception(ex)
+            raise
+        with self.lock:
+            del self.in_flight[(key, version)]
+            self.entries[key] = (version, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        flight.set_result(payload)
+        return payload
+
+    def respond(self, request: Request, key: Hashable, version: Hashable, build: Callable[[], Any]) -> Response:
+        return self.get(key, version, build).to_response(request)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]):
+        with self.lock:
+            for key in [k for k in self.entries if predicate(k)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,54 @@
+import time
+from typing import Optional, Tuple
+
+from pydantic import BaseModel
+
+NOTHING = "nothing"
+
+
+class Detection(BaseModel):
+    object_name: str
+    prob: float
+    # 检测端的时间戳（秒，单调递增即可）；批量上报时用于计算停留时间，缺省时使用服务端收到的时间
+    ts: Optional[float] = None
+
+
+class DetectionFilter:
+    # 检测结果去抖：
+    # - 概率低于 min_prob 的检测忽略（nothing 除外）
+    # - 切换到其他物体前，该物体需要被连续检测到至少 min_dwell 秒
+    # - 同一物体只有概率变化不小于 min_prob_delta 时才更新
+    def __init__(self, min_dwell: float = 0.5, min_prob: float = 0.5, min_prob_delta: float = 0.05):
+        self.min_dwell = min_dwell
+        self.min_prob = min_prob
+        self.min_prob_delta = min_prob_delta
+        # 等待切换的候选物体及其第一次被检测到的时间
+        self.candidate: Optional[str] = None
+        self.candidate_since = 0.0
+
+    def configure(self, min_dwell: float, min_prob: float, min_prob_delta: float):
+        self.min_dwell = min_dwell
+        self.min_prob = min_prob
+        self.min_prob_delta = min_prob_delta
+
+    def offer(self, current: Tuple[str, float], object_name: str, prob: float,
+              ts: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        # 返回需要广播的新状态，不需要更新时返回 None
+        now = time.monotonic() if ts is None else ts
+        if object_name != NOTHING and prob < self.min_prob:
+            return None
+
+        current_name, current_prob = current
+        if object_name == current_name:
+            self.candidate = None
+            if abs(prob - current_prob) >= self.min_prob_delta:
+                return object_name, prob
+            return None
+
+        if object_name != self.candidate:
+            self.candidate = object_name
+            self.candidate_since = now
+        if now - self.candidate_since >= self.min_dwell:
+            self.candidate = None
+            return object_name, prob
+        return None
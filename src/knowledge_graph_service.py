@@ -1,11 +1,24 @@
 import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from graph_layout import radial_layout
 from log import logger_factory
-from typing import Dict, List
+from metrics import registry
+from typing import Dict, List, Optional, Tuple
 
 logger = logger_factory.get_logger(__name__)
 
+cache_requests = registry.counter("kg_cache_requests_total", "Knowledge graph cache lookups by result.", ("result",))
+cache_evictions = registry.counter("kg_cache_evictions_total", "Knowledge graph cache entries evicted by size limits.")
+
 
 class TreeNode:
+    __slots__ = ("id", "text", "level", "type", "branch", "children")
+
     def __init__(self, _id="", value="", level=0, _type="", branch=""):
         self.id: str = _id
         self.text: str = value
@@ -46,91 +59,257 @@ class TreeNode:
         return self.to_json()
 
 
-class KnowledgeGraphService:
-    def __init__(self):
-        self.branch_flag = 0
-        self.cache = dict()
+def copy_graph(graph: Dict):
+    # 节点和边只有两层嵌套，逐层复制即可与缓存隔离
+    return {
+        "nodes": [{"id": n["id"], "data": dict(n["data"])} for n in graph["nodes"]],
+        "edges": [dict(e) for e in graph["edges"]]
+    }
 
-    def read_raw_data(self, path: str):
-        if not path:
-            logger.error(f"file not found: {path}.")
+
+class GraphIndex:
+    # 缓存的完整图及 父节点 -> 子节点 索引；build_graph 的 id 即节点在列表中的位置，第 i 条边指向第 i + 1 个节点
+    def __init__(self, graph: Dict):
+        self.graph = graph
+        nodes = graph["nodes"]
+        self.children: List[List[int]] = [[] for _ in nodes]
+        # 分支号 -> 第一层节点位置；同一第一层节点下的子树分支号相同
+        self.branch_roots: Dict[str, List[int]] = dict()
+        for i, edge in enumerate(graph["edges"]):
+            parent = int(edge["source"])
+            self.children[parent].append(i + 1)
+            if parent == 0:
+                self.branch_roots.setdefault(nodes[i + 1]["data"]["branch"], []).append(i + 1)
+        # 节点坐标，第一次请求时计算，之后随图一起缓存
+        self.layout: Optional[np.ndarray] = None
+
+    def position(self, node_id: str) -> Optional[int]:
+        if not node_id.isdigit() or int(node_id) >= len(self.children):
             return None
-        if path in self.cache:
-            return self.cache[path]
+        return int(node_id)
 
-        logger.debug(f"reading data in {path}.")
-        data: Dict = json.load(open(path, "r", encoding="utf-8"))
-        logger.debug(f"reading data in {path} finish.")
-        self.cache[path] = data
-        return data
+    def node(self, node_id: str) -> Optional[Dict]:
+        i = self.position(node_id)
+        return None if i is None else self.graph["nodes"][i]
 
-    def get_graph_data(self, name: str, path: str):
-        tree = self.translate_tree(name, path)
-        nodes = [tree.to_graph_node()]
-        edges = []
-        self._tree_to_graph(tree, nodes, edges)
+    def get_layout(self) -> np.ndarray:
+        # 并发请求可能重复计算一次，结果相同，不需要加锁
+        if self.layout is None:
+            nodes = self.graph["nodes"]
+            parents = np.zeros(len(nodes), dtype=np.int64)
+            parents[1:] = [int(edge["source"]) for edge in self.graph["edges"]]
+            levels = np.fromiter((n["data"]["level"] for n in nodes), dtype=np.int64, count=len(nodes))
+            self.layout = radial_layout(parents, levels)
+        return self.layout
+
+    def positions(self, node_ids: List[str]) -> Dict[str, List[float]]:
+        layout = self.get_layout()
+        res = dict()
+        for node_id in node_ids:
+            i = self.position(node_id)
+            if i is not None:
+                # 加 0.0 去掉 -0.0
+                res[node_id] = [round(float(layout[i, 0]), 3) + 0.0, round(float(layout[i, 1]), 3) + 0.0]
+        return res
+
+    def _node(self, i: int) -> Dict:
+        node = self.graph["nodes"][i]
+        # childCount 供前端判断节点是否可以继续展开
+        return {"id": node["id"], "data": dict(node["data"], childCount=len(self.children[i]))}
+
+    def _walk(self, roots: List[int], max_level: Optional[int], nodes: list, edges: list):
+        # 先序遍历，只访问输出的节点，开销与输出大小成正比；roots 同属一层
+        all_nodes, all_edges = self.graph["nodes"], self.graph["edges"]
+        if not roots or (max_level is not None and all_nodes[roots[0]]["data"]["level"] > max_level):
+            return
+        stack = list(reversed(roots))
+        while stack:
+            i = stack.pop()
+            nodes.append(self._node(i))
+            edges.append(dict(all_edges[i - 1]))
+            if max_level is None or all_nodes[i]["data"]["level"] < max_level:
+                stack.extend(reversed(self.children[i]))
+
+    def subgraph(self, depth: Optional[int] = None, branch: Optional[str] = None,
+                 expand: Optional[str] = None) -> Dict:
+        # depth 为最大层级（根节点为 0）；expand 时只返回该节点的后代，默认只有直接子节点
+        nodes, edges = [], []
+        if expand is not None:
+            i = self.position(expand)
+            if i is not None:
+                level = self.graph["nodes"][i]["data"]["level"]
+                self._walk(self.children[i], level + 1 if depth is None else depth, nodes, edges)
+        else:
+            nodes.append(self._node(0))
+            roots = self.children[0] if branch is None else self.branch_roots.get(branch, [])
+            self._walk(roots, depth, nodes, edges)
         return {
             "nodes": nodes,
             "edges": edges
         }
 
-    def _tree_to_graph(self, parent: TreeNode, nodes: list, edges: list):
-        children: List[TreeNode] = parent.children
-        for v in children:
-            nodes.append(v.to_graph_node())
-            edges.append({
-                "source": parent.id,
-                "target": v.id
-            })
-            self._tree_to_graph(v, nodes, edges)
 
-    def translate_tree(self, name: str, path: str):
-        # 计数器，用于生成节点id
-        counter = [0]
-        # 节点层级
-        level = 0
-        # 根节点
-        root = TreeNode(str(counter[0]), name, level, "root", str(0))
-        self.branch_flag = 1
-        counter[0] += 1
-
-        # 原始数据
+class GraphCache:
+    # 以 (文件, 名称) 为键的 LRU 缓存，按条目数和源文件字节数限制大小，文件 mtime 变化即失效
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        # key -> (mtime_ns, size, GraphIndex)
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[int, int, GraphIndex]]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str], mtime_ns: int) -> Optional[GraphIndex]:
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                cache_requests.inc("miss")
+                return None
+            if item[0] != mtime_ns:
+                del self.entries[key]
+                self.total_bytes -= item[1]
+                cache_requests.inc("stale")
+                return None
+            self.entries.move_to_end(key)
+            cache_requests.inc("hit")
+            return item[2]
+
+    def put(self, key: Tuple[str, str], mtime_ns: int, size: int, graph: GraphIndex):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (mtime_ns, size, graph)
+            self.total_bytes += size
+            self._evict()
+
+    def resize(self, max_entries: int, max_bytes: int):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        # 调用方持有锁；最近写入的单个超大条目也保留，避免每次请求都重建
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted[1]
+            cache_evictions.inc()
+
+    def invalidate(self, path: str):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == path]:
+                self.total_bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class KnowledgeGraphService:
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.cache = GraphCache(max_entries, max_bytes)
+
+    def read_raw_data(self, path: str):
+        if not path:
+            logger.error("file not found: %s.", path)
+            return None
+
+        logger.debug("reading data in %s.", path)
+        with open(path, "r", encoding="utf-8") as file:
+            data: Dict = json.load(file)
+        logger.debug("reading data in %s finish.", path)
+        return data
+
+    def get_graph_index(self, name: str, path: str) -> GraphIndex:
+        # 缓存中的对象，调用方不能修改
+        stat = os.stat(path)
+        key = (path, name)
+        index = self.cache.get(key, stat.st_mtime_ns)
+        if index is None:
+            index = GraphIndex(self._build_graph_data(name, path))
+            self.cache.put(key, stat.st_mtime_ns, stat.st_size, index)
+        return index
+
+    def put_graph(self, name: str, path: str, mtime_ns: int, size: int, graph: Dict):
+        # 放入预先构建好的图（例如预编译产物），mtime 与源文件不符时会被当作过期重新构建
+        self.cache.put((path, name), mtime_ns, size, GraphIndex(graph))
+
+    def get_graph_data(self, name: str, path: str, depth: Optional[int] = None, branch: Optional[str] = None,
+                       expand: Optional[str] = None):
+        # 返回缓存图的副本，调用方可以随意修改；指定 depth / branch / expand 时只返回相应的部分
+        index = self.get_graph_index(name, path)
+        if depth is None and branch is None and expand is None:
+            return copy_graph(index.graph)
+        return index.subgraph(depth, branch, expand)
+
+    def _build_graph_data(self, name: str, path: str):
         raw = self.read_raw_data(path)
-        logger.debug(f"raw data: {raw}")
-        self._translate_sub_tree(root, raw, level + 1, counter)
-        logger.debug(f"translated data: {root}")
+        logger.debug("raw data: %s", raw)
+        return build_graph(name, raw)
 
+    def translate_tree(self, name: str, path: str):
+        # 由 build_graph 的结果还原为 TreeNode 树，节点按先序排列，父节点总在子节点之前
+        graph = self._build_graph_data(name, path)
+        nodes = dict()
+        for node in graph["nodes"]:
+            data = node["data"]
+            nodes[node["id"]] = TreeNode(node["id"], data["text"], data["level"], data["type"], data["branch"])
+        for edge in graph["edges"]:
+            nodes[edge["source"]].children.append(nodes[edge["target"]])
+        root = nodes["0"]
+        # 参数延迟格式化，DEBUG 未开启时不会序列化整棵树
+        logger.debug("translated data: %s", root)
         return root
 
-    def _translate_sub_tree(self, parent, children, level, counter):
-        # 如果子节点是字符串
-        if isinstance(children, str):
-            parent.children.append(TreeNode(str(counter[0]), children.strip(), level, "leaf", str(self.branch_flag)))
-            counter[0] += 1
-        # 如果子节点是列表
-        elif isinstance(children, list):
-            for i, v in enumerate(children):
-                if isinstance(v, str):
-                    node = TreeNode(str(counter[0]), v.strip(), level, "leaf", str(self.branch_flag))
-                    parent.children.append(node)
-                    counter[0] += 1
-                    continue
-
-                node = TreeNode(str(counter[0]), str(i), level, "sub", str(self.branch_flag))
-                parent.children.append(node)
-                counter[0] += 1
-                self._translate_sub_tree(node, v, level + 1, counter)
-        elif isinstance(children, dict):
-            for k, v in children.items():
-                node = TreeNode(str(counter[0]), k, level, "sub", str(self.branch_flag))
-                parent.children.append(node)
-                counter[0] += 1
-                self._translate_sub_tree(node, v, level + 1, counter)
-                if level == 1:
-                    self.branch_flag += 1
-        else:
-            # 其他数据类型直接丢弃
-            logger.warning(f"unprocessable children data type: {type(children)}, children value: {children}.")
+
+def _push_children(stack: list, parent_id: str, children, level: int):
+    # 按原顺序的逆序入栈，出栈时即为先序；栈元素为 (父节点 id, 文本, 层级, 类型, 子数据)
+    if isinstance(children, str):
+        stack.append((parent_id, children.strip(), level, "leaf", None))
+    elif isinstance(children, list):
+        for i in range(len(children) - 1, -1, -1):
+            v = children[i]
+            if isinstance(v, str):
+                stack.append((parent_id, v.strip(), level, "leaf", None))
+            else:
+                stack.append((parent_id, str(i), level, "sub", v))
+    elif isinstance(children, dict):
+        for k, v in reversed(list(children.items())):
+            # 第一层的每个键处理完整个子树后分支号加一，None 作为标记
+            if level == 1:
+                stack.append(None)
+            stack.append((parent_id, k, level, "sub", v))
+    else:
+        # 其他数据类型直接丢弃
+        logger.warning("unprocessable children data type: %s, children value: %s.", type(children), children)
+
+
+def build_graph(name: str, raw) -> Dict:
+    # 显式栈的先序遍历，一次生成 nodes/edges；id 为先序编号，与原递归实现的编号、层级和分支号一致
+    nodes = [{"id": "0", "data": {"branch": "0", "text": name, "level": 0, "type": "root"}}]
+    edges = []
+    counter = 1
+    branch = "1"
+    stack = []
+    _push_children(stack, "0", raw, 1)
+    while stack:
+        item = stack.pop()
+        if item is None:
+            branch = str(int(branch) + 1)
+            continue
+        parent_id, text, level, node_type, children = item
+        node_id = str(counter)
+        counter += 1
+        nodes.append({"id": node_id, "data": {"branch": branch, "text": text, "level": level, "type": node_type}})
+        edges.append({"source": parent_id, "target": node_id})
+        if node_type == "sub":
+            _push_children(stack, node_id, children, level + 1)
+    return {
+        "nodes": nodes,
+        "edges": edges
+    }
 
 
 if __name__ == '__main__':
@@ -1,15 +1,66 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+from typing import Dict, Tuple
 
-logging.basicConfig(level=logging.DEBUG, format='%(levelname)s %(asctime)s %(name)s %(message)s')
+FORMAT = '%(levelname)s %(asctime)s %(name)s %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # 默认的 prepare 会在调用线程中格式化消息；进程内队列不需要序列化，原样交给后台线程格式化和输出
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    # 按调用位置限流：每个 interval 秒内最多输出 burst 条，之后输出的第一条附带被丢弃的数量
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # (文件, 行号) -> [窗口开始时间, 窗口内条数, 被丢弃条数]
+        self.sites: Dict[Tuple[str, int], list] = dict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+        now = record.created
+        if site is None or now - site[0] >= self.interval:
+            suppressed = site[2] if site is not None else 0
+            self.sites[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        return False
 
 
 class LoggerFactory:
     def __init__(self):
         self.loggers = []
+        self.rate_limit = RateLimitFilter()
+        # 格式化和 I/O 在 QueueListener 的后台线程中完成，调用方只做一次入队
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(FORMAT))
+        self.listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+        logging.basicConfig(level=logging.DEBUG, handlers=[DeferredQueueHandler(self.queue)])
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
 
-    def get_logger(self, name: str, level: int = logging.DEBUG):
+    def get_logger(self, name: str, level: int = logging.DEBUG, rate_limited: bool = False):
+        # rate_limited 用于可能被高频触发的日志（如每次状态更新、每个连接断开）
         logger = logging.getLogger(name)
         logger.setLevel(level)
+        if rate_limited:
+            logger.addFilter(self.rate_limit)
         self.loggers.append(logger)
         return logger
 
@@ -17,5 +68,15 @@ class LoggerFactory:
         for logger in self.loggers:
             logger.setLevel(level)
 
+    def set_rate_limit(self, interval: float, burst: int):
+        self.rate_limit.interval = interval
+        self.rate_limit.burst = burst
+
+    def stop(self):
+        # 退出前输出队列中剩余的日志
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
 
 logger_factory = LoggerFactory()
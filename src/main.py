@@ -1,29 +1,156 @@
 import asyncio
 import json
-import random
+import os
+import signal
+from contextlib import asynccontextmanager
+from typing import Callable, Coroutine, Dict, List, Optional, Set
 
 import click
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
 from object_service import ObjectService
 from log import logger_factory
 from config import Config
+from display_state import (DEFAULT_CHANNEL, LocalDisplayBackend, UnixSocketDisplayBackend, create_display_backend,
+                           valid_channel)
+from http_cache import PayloadCache
+from ingestion import NOTHING, Detection, DetectionFilter
+from media import MediaStaticFiles, StaticCorsMiddleware
+from metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from profiling import Sampler, install as install_profiling
+from static_assets import StaticAssets
 from utils import Res, WebSocketsManager
+from vector_store import binary_response, select_rows
+from watcher import watch_directory
 
-logger = logger_factory.get_logger(__name__)
+logger = logger_factory.get_logger(__name__, rate_limited=True)
 
 service = ObjectService("static/objects")
 
+# 多 worker 时每个进程都会重新导入本模块，配置文件路径通过环境变量传递
+CONFIG_ENV = "DATA_VISUALIZATION_CONFIG"
+
 cfg = Config()
-CURRENT = "nothing"
-CURRENT_PROB = 0
 manager = WebSocketsManager()
+payloads = PayloadCache()
+# 前端页面和打包文件常驻内存
+site_files = StaticAssets("static")
+asset_files = StaticAssets("static/assets")
+# 各频道当前展示的物体，多 worker 时由共享的 backend 同步
+display = LocalDisplayBackend()
+# 正在进行的后台任务（预热、重新加载），保持引用避免被回收
+background_tasks = set()
+# 各频道最近一次通知的物体，只有物体变化（而不是概率变化）时才预热
+notified_objects: Dict[str, str] = dict()
+# 检测端上报的去抖状态，每个频道一个
+detection_filters: Dict[str, DetectionFilter] = dict()
+# /admin/profile 的采样线程
+sampler = Sampler()
+
+registry.gauge("ws_connections", "Open WebSocket connections in this worker.", lambda: len(manager.store))
+registry.gauge("kg_cache_entries", "Knowledge graph cache entries.",
+               lambda: len(service.knowledge_graph_service.cache.entries))
+registry.gauge("kg_cache_bytes", "Source bytes of cached knowledge graphs.",
+               lambda: service.knowledge_graph_service.cache.total_bytes)
+
+
+def display_message(object_name: str, prob: float):
+    return json.dumps({"object_name": object_name, "prob": prob}, ensure_ascii=False)
+
+
+async def on_display_change(channel: str, object_name: str, prob: float):
+    # 先开始预热新物体的数据再通知展示端；多 worker 时每个进程都会收到变化并各自预热，各频道共用同一份缓存
+    if notified_objects.get(channel) != object_name:
+        notified_objects[channel] = object_name
+        warm_object(object_name)
+    # 状态变化时只编码一次，该频道的所有连接共享
+    await manager.publish(display_message(object_name, prob), channel)
+
+
+def apply_config():
+    logger_factory.set_level(cfg.log_level)
+    logger_factory.set_rate_limit(cfg.log_rate_limit_interval, cfg.log_rate_limit_burst)
+    service.knowledge_graph_service.cache.resize(cfg.kg_cache_max_entries, cfg.kg_cache_max_bytes)
+    manager.queue_size = cfg.ws_queue_size
+    manager.send_timeout = cfg.ws_send_timeout
+    media_files.max_age = cfg.media_max_age
+    for detection_filter in detection_filters.values():
+        detection_filter.configure(cfg.ingest_min_dwell, cfg.ingest_min_prob, cfg.ingest_min_prob_delta)
+    service.set_base_directory(cfg.static_objects_directory)
+
+
+def spawn(coro: Coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(on_task_done)
+    return task
+
+
+def on_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("background task failed: %r.", task.exception())
+
+
+async def reload_objects() -> Set[str]:
+    # 在线程池中构建新的物体索引后整体替换，正在处理的请求继续使用旧索引；变化的物体的响应缓存一并清除
+    changed = await run_in_threadpool(service.reload)
+    if changed:
+        payloads.invalidate(lambda key: key[1] in changed)
+    return changed
 
-app = FastAPI()
+
+async def watch_objects(interval: float):
+    async for _ in watch_directory(service.base_directory, interval):
+        try:
+            await reload_objects()
+        except Exception as ex:
+            logger.warning("reload failed: %r.", ex)
+
+
+def install_reload_signal() -> bool:
+    # kill -HUP <pid> 触发重新加载；Windows 没有 SIGHUP，非主线程中运行时（例如测试）无法注册
+    if not hasattr(signal, "SIGHUP"):
+        return False
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: spawn(reload_objects()))
+    except (ValueError, RuntimeError, NotImplementedError) as ex:
+        logger.debug("can not install SIGHUP handler: %s.", ex)
+        return False
+    return True
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global display
+    config = os.environ.get(CONFIG_ENV)
+    if config:
+        cfg.parse(config)
+        apply_config()
+        display = create_display_backend(cfg.get_display_backend(), cfg.display_socket_directory)
+    if cfg.profiling_enabled:
+        install_profiling(app, cfg.profiling_directory)
+        logger.warning("profiling is enabled, profiles are written to %s.", cfg.profiling_directory)
+    site_files.get("index.html")
+    asset_files.preload()
+    await display.start(on_display_change)
+    sighup = install_reload_signal()
+    watcher = spawn(watch_objects(cfg.reload_watch_interval)) if cfg.reload_watch_interval > 0 else None
+    try:
+        yield
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if sighup:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+        await display.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,33 +159,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
+app.add_middleware(StaticCorsMiddleware, prefix="/static")
+# 最后添加的中间件在最外层，耗时包含其他中间件
+app.add_middleware(MetricsMiddleware)
+# 静态文件支持 Range / If-Range，视频片段可以按区间拉取
+media_files = MediaStaticFiles(directory="static")
+app.mount("/static", media_files, name="static")
 
-@app.middleware("http")
-async def static_resource_cors_middleware(request: Request, call_next):
-    if request.url and request.url.path.startswith("/static"):
-        response = await call_next(request)
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        return response
 
-    return await call_next(request)
-
-
-@app.get("/index", response_class=HTMLResponse)
-def index():
-    with open("static/index.html", "r", encoding="utf-8") as file:
-        return file.read()
+@app.get("/index")
+def index(request: Request):
+    return site_files.response(request, "index.html")
 
 
 @app.get("/assets/{item}")
-def assets(item: str):
-    if item and item.endswith("js"):
-        return FileResponse(f"static/assets/{item}", media_type="text/javascript")
-
-    return FileResponse(f"static/assets/{item}")
+def assets(request: Request, item: str):
+    return asset_files.response(request, item)
 
 
 @app.get("/object_names")
@@ -66,8 +182,16 @@ async def object_names():
     return service.get_object_names()
 
 
+def invalid_channel_response():
+    return JSONResponse(Res.message("invalid channel name."), status_code=400)
+
+
 @app.get("/update_display")
-async def update_display(object_name: str, prob: float):
+async def update_display(object_name: str, prob: float, channel: str = DEFAULT_CHANNEL):
+    # channel：展厅（显示组）名称，只通知订阅了该频道的展示端
+    if not valid_channel(channel):
+        return invalid_channel_response()
+
     if not object_name:
         logger.warning("object_name can not be blank.")
         return Res.message("object_name can not be blank.")
@@ -76,66 +200,263 @@ async def update_display(object_name: str, prob: float):
         logger.warning("unknown object name.")
         return Res.message("unknown object name")
 
-    logger.info(f"update_display: {object_name}")
-    global CURRENT, CURRENT_PROB
-    CURRENT = object_name
-    CURRENT_PROB = prob
-    await manager.publish(json.dumps({"object_name": object_name, "prob": prob}, ensure_ascii=False))
+    if (object_name, prob) == display.current(channel):
+        return Res.message("success")
+
+    logger.info("update_display: %s %s", channel, object_name)
+    await display.update(object_name, prob, channel)
     return Res.message("success")
 
 
+def get_detection_filter(channel: str) -> DetectionFilter:
+    detection_filter = detection_filters.get(channel)
+    if detection_filter is None:
+        detection_filter = detection_filters[channel] = DetectionFilter(
+            cfg.ingest_min_dwell, cfg.ingest_min_prob, cfg.ingest_min_prob_delta)
+    return detection_filter
+
+
+async def ingest(detection: Detection, channel: str = DEFAULT_CHANNEL) -> bool:
+    # 返回是否产生了状态变化；未知物体直接忽略
+    if detection.object_name != NOTHING and detection.object_name not in service.get_object_names():
+        return False
+    state = get_detection_filter(channel).offer(display.current(channel), detection.object_name, detection.prob,
+                                                detection.ts)
+    if state is None:
+        return False
+    logger.info("detection: %s %s %.3f", channel, *state)
+    await display.update(*state, channel)
+    return True
+
+
+@app.post("/detections")
+async def detections(batch: List[Detection], channel: str = DEFAULT_CHANNEL):
+    # 检测端批量上报，按顺序去抖，只有真正的状态变化才会广播
+    if not valid_channel(channel):
+        return invalid_channel_response()
+    updated = 0
+    for detection in batch:
+        if await ingest(detection, channel):
+            updated += 1
+    return Res.message({"received": len(batch), "updated": updated, "current": display.current(channel)[0]})
+
+
+@app.websocket("/ws/detections")
+async def detections_websocket(ws: WebSocket, channel: str = DEFAULT_CHANNEL):
+    # 检测端的长连接，每条消息为一个检测结果或检测结果列表，不回复
+    if not valid_channel(channel):
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    try:
+        while True:
+            message = await ws.receive_text()
+            try:
+                data = json.loads(message)
+                for item in data if isinstance(data, list) else [data]:
+                    await ingest(Detection(**item), channel)
+            except (ValueError, TypeError) as ex:
+                logger.warning("invalid detection message: %s.", ex)
+    except WebSocketDisconnect:
+        pass
+
+
 @app.get("/current_object_name")
-async def current_object_name():
-    return Res.message(CURRENT)
+async def current_object_name(channel: str = DEFAULT_CHANNEL):
+    if not valid_channel(channel):
+        return invalid_channel_response()
+    return Res.message(display.current(channel)[0])
+
+
+def vectors_payload(object_name: str):
+    return payloads.get(("vectors", object_name), service.get_source_version(object_name),
+                        lambda: Res.message(service.get_vectors(object_name)))
+
+
+def pictures_payload(object_name: str):
+    return payloads.get(("pictures", object_name), service.get_source_version(object_name),
+                        lambda: Res.message(service.get_images_and_subtitles(object_name)))
+
+
+def _knowledge_graph(object_name: str, image_size: Optional[int], image_format: str, depth: Optional[int],
+                     branch: Optional[str], expand: Optional[str], atlas: bool):
+    # 知识图谱
+    data = service.get_knowledge_graph_data(object_name, depth, branch, expand)
+    # 知识图谱图片
+    images, sprites = service.get_knowledge_images(object_name, image_size, image_format, atlas)
+    res = {"name": object_name, "data": data, "images": images}
+    if atlas:
+        # 与 images 一一对应的图集位置 [图集 url, x, y, w, h]
+        res["sprites"] = [sprites.get(url) for url in images]
+    return Res.message(res)
+
+
+def knowledge_graph_payload(object_name: str, image_size: Optional[int] = None, image_format: str = "jpg",
+                            depth: Optional[int] = None, branch: Optional[str] = None, expand: Optional[str] = None,
+                            atlas: bool = False):
+    return payloads.get(("knowledge_graph", object_name, image_size, image_format, depth, branch, expand, atlas),
+                        service.get_source_version(object_name),
+                        lambda: _knowledge_graph(object_name, image_size, image_format, depth, branch, expand, atlas))
+
+
+def knowledge_graph_ex_payload(object_name: str, image_size: Optional[int] = None, image_format: str = "jpg",
+                               depth: Optional[int] = None, branch: Optional[str] = None,
+                               expand: Optional[str] = None, positions: bool = False, atlas: bool = False):
+    return payloads.get(("knowledge_graph_ex", object_name, image_size, image_format, depth, branch, expand,
+                         positions, atlas),
+                        service.get_source_version(object_name),
+                        lambda: Res.message({"name": object_name, "data": service.get_knowledge_graph_data_ex(
+                            object_name, image_size, image_format, depth, branch, expand, positions, atlas)}))
+
+
+# 切换物体后各展示端会立即请求的数据（默认参数）
+WARM_PAYLOADS = (pictures_payload, knowledge_graph_ex_payload, knowledge_graph_payload, vectors_payload)
+
+
+def warm_payload(build: Callable, object_name: str):
+    # 生成响应并预先压缩，展示端的请求直接命中缓存
+    payload = build(object_name)
+    for encoding in payload.available_encodings():
+        payload.variant(encoding)
+
+
+def warm_object(object_name: str):
+    # 在线程池中并行预热；此时到达的相同请求会等待同一次生成（PayloadCache 的 single-flight）
+    if object_name not in service.get_object_names():
+        return
+    for build in WARM_PAYLOADS:
+        spawn(run_in_threadpool(warm_payload, build, object_name))
 
 
 @app.get("/vectors")
-def vectors(object_name: str):
-    return Res.message(service.get_vectors(object_name))
+def vectors(request: Request, object_name: str, fmt: str = Query("json", alias="format"), start: int = 0,
+            stop: Optional[int] = None, stride: int = 1, max_rows: Optional[int] = None):
+    if fmt == "binary":
+        # 二进制模式：每位一个字节的行主序数据，支持行区间切片和按步长降采样
+        array = service.get_vector_array(object_name)
+        if array is None:
+            return JSONResponse(Res.message("vectors not found."), status_code=404)
+        try:
+            return binary_response(select_rows(array, start, stop, stride, max_rows))
+        except ValueError as ex:
+            return JSONResponse(Res.message(str(ex)), status_code=400)
+
+    return vectors_payload(object_name).to_response(request)
 
 
 @app.get("/pictures")
-def pictures(object_name: str):
-    return Res.message(service.get_images_and_subtitles(object_name))
+def pictures(request: Request, object_name: str):
+    return pictures_payload(object_name).to_response(request)
 
 
+# depth：最大层级（根节点为 0）；branch：只返回该分支；expand：只返回该节点的子节点（配合 depth 可返回多层后代）
 @app.get("/knowledge_graph")
-def knowledge_graph(object_name: str):
-    # 知识图谱
-    data = service.get_knowledge_graph_data(object_name)
-    # 知识图谱图片
-    images = service.get_knowledge_image_urls(object_name)
-    return Res.message({"name": object_name, "data": data, "images": images})
+def knowledge_graph(request: Request, object_name: str, image_size: Optional[int] = None, image_format: str = "jpg",
+                    depth: Optional[int] = Query(None, ge=0), branch: Optional[str] = None,
+                    expand: Optional[str] = None, atlas: bool = False):
+    return knowledge_graph_payload(object_name, image_size, image_format, depth, branch, expand,
+                                   atlas).to_response(request)
 
 
 @app.get("/knowledge_graph_ex")
-def knowledge_graph_ex(object_name: str):
-    # 知识图谱, all in one
-    return Res.message({"name": object_name, "data": service.get_knowledge_graph_data_ex(object_name)})
+def knowledge_graph_ex(request: Request, object_name: str, image_size: Optional[int] = None,
+                       image_format: str = "jpg", depth: Optional[int] = Query(None, ge=0),
+                       branch: Optional[str] = None, expand: Optional[str] = None, positions: bool = False,
+                       atlas: bool = False):
+    # 知识图谱, all in one；positions=true 时附带服务端计算的节点坐标，atlas=true 时附带节点图片在图集中的位置
+    return knowledge_graph_ex_payload(object_name, image_size, image_format, depth, branch, expand,
+                                      positions, atlas).to_response(request)
+
+
+@app.get("/search")
+def search(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    # 在所有物体的知识图谱节点（type=node）和字幕（type=segment）中搜索，按相关度排序
+    return Res.message({"query": q, "hits": service.search(q, limit)})
+
+
+@app.post("/admin/reload")
+async def admin_reload():
+    # 手动触发重新加载，只作用于收到请求的 worker；多 worker 时依赖各进程的目录监听
+    changed = await reload_objects()
+    return Res.message({"changed": sorted(changed), "objects": len(service.get_object_names())})
+
+
+@app.post("/admin/profile")
+def admin_profile(seconds: float = Query(10.0, gt=0, le=300)):
+    # 对事件循环和线程池采样 seconds 秒，结束后在 profiling_directory 生成 collapsed stack 文件，可用 flamegraph.pl 等工具绘制
+    if not cfg.profiling_enabled:
+        return JSONResponse(Res.message("profiling is disabled."), status_code=403)
+    if sampler.running():
+        return JSONResponse(Res.message("profiling is already running."), status_code=409)
+    file = sampler.start(seconds, cfg.profiling_sample_interval, cfg.profiling_directory)
+    return Res.message({"file": file, "seconds": seconds})
+
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus 文本格式；多 worker 时每个进程单独统计
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
+async def websocket_endpoint(ws: WebSocket, channel: str = DEFAULT_CHANNEL):
+    # 订阅一个频道（展厅），只接收该频道的状态变化
+    if not valid_channel(channel):
+        await ws.close(code=1008)
+        return
     await ws.accept()
-    await manager.add(ws)
+    # 连接时先推送当前状态，之后只在状态变化时由 manager 推送；存活检测由协议层 ping/pong 完成
+    await manager.add(ws, display_message(*display.current(channel)), channel)
     try:
         while True:
-            await ws.send_text(json.dumps({"object_name": CURRENT, "prob": CURRENT_PROB}, ensure_ascii=False))
-            await ws.receive()
-            await asyncio.sleep(1.0 + random.random() * 0.5)
+            # 客户端发来的消息（如确认）直接忽略，只用于感知断开
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except Exception as ex:
-        await manager.remove(ws)
         logger.debug(ex)
+    finally:
+        await manager.remove(ws)
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option('--config', default='config.json', help='Path to the configuration file (default: config.json).')
-def main(config: str):
+@click.pass_context
+def main(ctx: click.Context, config: str):
+    # 不带子命令时启动服务
+    ctx.obj = config
+    if ctx.invoked_subcommand is None:
+        serve(config)
+
+
+def serve(config: str):
+    # 配置在 lifespan 中加载，这里只读取启动参数
+    os.environ[CONFIG_ENV] = os.path.abspath(config)
     cfg.parse(config)
     logger_factory.set_level(cfg.log_level)
-    service.set_base_directory(cfg.static_objects_directory)
 
-    uvicorn.run(app, host="0.0.0.0", port=9999)
+    options = dict(host="0.0.0.0", port=9999, ws_ping_interval=cfg.ws_ping_interval,
+                   ws_ping_timeout=cfg.ws_ping_timeout)
+    if cfg.workers > 1:
+        if cfg.get_display_backend() == "unix":
+            UnixSocketDisplayBackend.reset(cfg.display_socket_directory)
+        uvicorn.run("main:app", workers=cfg.workers, **options)
+    else:
+        uvicorn.run(app, **options)
+
+
+@main.command("compile", help="Pack every object directory into a prebuilt bundle.")
+@click.option('--force', is_flag=True, help='Rebuild bundles that are already up to date.')
+@click.pass_obj
+def compile_objects(config: str, force: bool):
+    # 把 static_objects_directory 下的每个物体目录编译为 .cache/bundle.json，服务启动时优先加载
+    cfg.parse(config)
+    logger_factory.set_level(cfg.log_level)
+    service.set_base_directory(cfg.static_objects_directory)
+    compiled, skipped, failed = service.compile_bundles(force)
+    click.echo(f"compiled: {compiled}, up to date: {skipped}, failed: {failed}")
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
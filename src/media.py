@@ -0,0 +1,220 @@
+import os
+import secrets
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional, Tuple, Union
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from static_assets import guess_media_type
+
+PathLike = Union[str, "os.PathLike[str]"]
+
+CHUNK_SIZE = 256 * 1024
+# 超过该数量的区间按整个文件返回，避免构造过大的 multipart 响应
+MAX_RANGES = 16
+ZERO_COPY_EXTENSION = "http.response.zerocopysend"
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    # 返回闭区间列表；格式不合法返回 None（按整个文件处理），无可满足区间返回空列表
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not start:
+                # 后缀区间：最后 N 个字节
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            first = int(start)
+            last = int(end) if end else size - 1
+        except ValueError:
+            return None
+        if first >= size:
+            continue
+        if first > last:
+            return None
+        ranges.append((first, min(last, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def read_at(file, fd: int, count: int, offset: int) -> bytes:
+    # 在线程池中调用；Windows 没有 os.pread，改为 seek + read（每个请求单独打开文件，不会与其他请求共用位置）
+    if hasattr(os, "pread"):
+        return os.pread(fd, count, offset)
+    file.seek(offset)
+    return file.read(count)
+
+
+class MediaResponse:
+    # 支持 Range / If-Range / 条件请求的文件响应；服务器支持 zerocopysend 扩展时使用 sendfile
+    def __init__(self, path: PathLike, stat_result: os.stat_result, scope: Scope, max_age: int):
+        self.path = path
+        self.size = stat_result.st_size
+        self.media_type = guess_media_type(str(path))
+        # 与 starlette 的 Response 一致，文本类型附带字符集
+        if self.media_type.startswith("text/") and "charset=" not in self.media_type:
+            self.media_type = f"{self.media_type}; charset=utf-8"
+        self.etag = f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.mtime = int(stat_result.st_mtime)
+        self.headers = Headers(scope=scope)
+        self.method = scope["method"]
+        self.zero_copy = ZERO_COPY_EXTENSION in scope.get("extensions", {})
+        self.base_headers = [
+            (b"accept-ranges", b"bytes"),
+            (b"etag", self.etag.encode()),
+            (b"last-modified", self.last_modified.encode()),
+            (b"cache-control", f"public, max-age={max_age}".encode()),
+        ]
+
+    def _not_modified(self) -> bool:
+        if_none_match = self.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = self.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_allowed(self) -> bool:
+        # If-Range 不匹配时忽略 Range，返回整个文件
+        if_range = self.headers.get("if-range")
+        if if_range is None:
+            return True
+        if if_range.startswith('"'):
+            return if_range == self.etag
+        return if_range == self.last_modified
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self._not_modified():
+            await send({"type": "http.response.start", "status": 304, "headers": self.base_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = self.headers.get("range")
+        if range_header and self._range_allowed():
+            ranges = parse_range(range_header, self.size)
+            if ranges == []:
+                await send({"type": "http.response.start", "status": 416,
+                            "headers": self.base_headers + [(b"content-range", f"bytes */{self.size}".encode())]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if not ranges:
+            await self._send_parts(send, 200, [], [(0, self.size - 1)], self.media_type)
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            await self._send_parts(send, 206, [(b"content-range", f"bytes {first}-{last}/{self.size}".encode())],
+                                   ranges, self.media_type)
+        else:
+            await self._send_multipart(send, ranges)
+
+    async def _send_parts(self, send: Send, status: int, extra_headers, ranges, media_type: str,
+                          preambles: Optional[List[bytes]] = None, epilogue: bytes = b""):
+        length = sum(last - first + 1 for first, last in ranges if last >= first)
+        length += sum(len(p) for p in preambles or []) + len(epilogue)
+        headers = self.base_headers + extra_headers + [
+            (b"content-type", media_type.encode("latin-1")),
+            (b"content-length", str(length).encode()),
+        ]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if self.method == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # 打开文件也可能阻塞（网络文件系统、冷缓存），与读取一样放到线程中
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            fd = file.fileno()
+            for i, (first, last) in enumerate(ranges):
+                if preambles:
+                    await send({"type": "http.response.body", "body": preambles[i], "more_body": True})
+                more = bool(epilogue) or i < len(ranges) - 1
+                await self._send_range(send, file, fd, first, last - first + 1, more)
+            if epilogue:
+                await send({"type": "http.response.body", "body": epilogue})
+        finally:
+            file.close()
+
+    async def _send_range(self, send: Send, file, fd: int, offset: int, count: int, more_body: bool):
+        if self.zero_copy:
+            await send({"type": ZERO_COPY_EXTENSION, "file": file, "offset": offset, "count": count,
+                        "more_body": more_body})
+            return
+        while count > 0:
+            chunk = await anyio.to_thread.run_sync(read_at, file, fd, min(CHUNK_SIZE, count), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            count -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body or count > 0})
+        if count > 0:
+            # 文件在发送过程中被截断
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_multipart(self, send: Send, ranges: List[Tuple[int, int]]):
+        boundary = secrets.token_hex(12)
+        preambles = [
+            (f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+             f"Content-Range: bytes {first}-{last}/{self.size}\r\n\r\n").encode("latin-1")
+            if i == 0 else
+            (f"\r\n--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+             f"Content-Range: bytes {first}-{last}/{self.size}\r\n\r\n").encode("latin-1")
+            for i, (first, last) in enumerate(ranges)
+        ]
+        epilogue = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        await self._send_parts(send, 206, [], ranges, f"multipart/byteranges; boundary={boundary}",
+                               preambles, epilogue)
+
+
+class MediaStaticFiles(StaticFiles):
+    # 替换 StaticFiles 的文件响应，使 /static 下的视频等大文件支持断点和区间请求
+    def __init__(self, *args, max_age: int = 3600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+
+    def file_response(self, full_path: PathLike, stat_result: os.stat_result, scope: Scope, status_code: int = 200):
+        if status_code != 200 or not stat.S_ISREG(stat_result.st_mode):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        return MediaResponse(full_path, stat_result, scope, self.max_age)
+
+
+class StaticCorsMiddleware:
+    # 纯 ASGI 中间件：只给 /static 响应追加 CORS 头，不包装响应体，文件仍可分块或零拷贝发送
+    def __init__(self, app: ASGIApp, prefix: str = "/static"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cors(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Access-Control-Allow-Origin"] = "*"
+                headers["Access-Control-Allow-Methods"] = "*"
+                headers["Access-Control-Allow-Headers"] = "*"
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
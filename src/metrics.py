@@ -0,0 +1,176 @@
+import bisect
+import time
+from typing import Callable, Dict, List, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 请求耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 热路径上只做字典查找和整数累加，不加锁也不格式化字符串，文本只在 /metrics 被抓取时生成。
+# 线程池中的并发累加在极少数情况下可能丢失一次计数，对监控可以接受。
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        # 标签值元组 -> 计数
+        self.values: Dict[Tuple, int] = dict()
+
+    def inc(self, *label_values, amount: int = 1):
+        values = self.values
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if not self.labels and not self.values:
+            # 无标签的计数从 0 开始导出，便于计算 rate
+            lines.append(f"{self.name} 0")
+        for label_values, value in sorted(list(self.values.items())):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Gauge:
+    # 抓取时调用 func 取值，例如当前 WebSocket 连接数
+    def __init__(self, name: str, documentation: str, func: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {_number(self.func())}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # 标签值元组 -> [各桶计数..., +Inf 桶计数, 总和]，桶计数不累积，抓取时再累加
+        self.series: Dict[Tuple, List] = dict()
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = [0] * (len(self.buckets) + 1) + [0.0]
+            self.series[label_values] = series
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(list(self.series.items())):
+            series = list(series)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = dict()
+
+    def _register(self, metric):
+        # 模块重复导入（如 uvicorn reload）时沿用已注册的指标
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+        # 回调型指标总是替换旧的，使其指向最新的对象
+        self.metrics[name] = Gauge(name, documentation, func)
+        return self.metrics[name]
+
+    def counter_func(self, name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+        # 已由其他对象自行累加的计数（例如缓存命中次数），抓取时读取
+        self.metrics[name] = Gauge(name, documentation, func, "counter")
+        return self.metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route, method and status.",
+                                 ("route", "method", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                                           ("route",))
+
+
+def route_label(scope: Scope) -> str:
+    # 使用路由模板（如 /assets/{item}）而不是实际路径，避免标签数量无限增长
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope and scope.get("root_path"):
+        # 挂载的子应用（/static）
+        return scope["root_path"]
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    # 纯 ASGI 中间件，记录每个请求的状态码和耗时
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            label = route_label(scope)
+            http_request_duration.observe(time.perf_counter() - start, label)
+            http_requests.inc(label, scope["method"], status)
@@ -0,0 +1,80 @@
+import json
+import os
+from stat import S_ISDIR
+from typing import Dict, List, Optional
+
+from http_cache import json_dumps, orjson
+from log import logger_factory
+from metrics import registry
+
+logger = logger_factory.get_logger(__name__)
+
+# 每次实际的文件系统调用计数一次；预编译产物、图集和向量缓存的读取都算在 ObjectService 名下
+fs_calls = registry.counter("object_service_fs_calls_total", "Filesystem calls made by ObjectService.", ("op",))
+
+# 预编译产物与二进制向量缓存放在同一个隐藏目录
+BUNDLE_DIRECTORY = ".cache"
+BUNDLE_FILE = "bundle.json"
+# 产物结构变化时递增，旧版本的产物视为过期
+BUNDLE_FORMAT = 1
+
+
+def bundle_path(object_path: str) -> str:
+    return os.path.join(object_path, BUNDLE_DIRECTORY, BUNDLE_FILE)
+
+
+def stat_sources(object_path: str, names: List[str]) -> List[list]:
+    # names 为相对物体目录的路径，"" 表示物体目录本身；目录只比较 mtime（增删文件时会变化）
+    sources = []
+    for name in names:
+        path = os.path.join(object_path, name) if name else object_path
+        fs_calls.inc("stat")
+        stat = os.stat(path)
+        size = 0 if S_ISDIR(stat.st_mode) else stat.st_size
+        sources.append([name, stat.st_mtime_ns, size])
+    return sources
+
+
+def is_fresh(object_path: str, sources: List[list]) -> bool:
+    for name, mtime_ns, size in sources:
+        path = os.path.join(object_path, name) if name else object_path
+        fs_calls.inc("stat")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_mtime_ns != mtime_ns or (size and stat.st_size != size):
+            return False
+    return True
+
+
+def write_bundle(object_path: str, bundle: Dict):
+    # 先写临时文件再替换，运行中的服务不会读到写了一半的产物
+    output = bundle_path(object_path)
+    tmp = f"{output}.{os.getpid()}.tmp"
+    fs_calls.inc("open")
+    with open(tmp, "wb") as file:
+        file.write(json_dumps(dict(bundle, format=BUNDLE_FORMAT)))
+    os.replace(tmp, output)
+
+
+def load_bundle(object_path: str) -> Optional[Dict]:
+    # 不存在、格式不符或源文件已变化时返回 None，由调用方回退到原始文件
+    path = bundle_path(object_path)
+    fs_calls.inc("open")
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    try:
+        bundle = orjson.loads(data) if orjson is not None else json.loads(data)
+    except ValueError as ex:
+        logger.warning("invalid bundle %s: %s.", path, ex)
+        return None
+    if bundle.get("format") != BUNDLE_FORMAT:
+        return None
+    if not is_fresh(object_path, bundle["sources"]):
+        logger.info("bundle %s is stale, using raw files.", path)
+        return None
+    return bundle
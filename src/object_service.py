@@ -1,11 +1,15 @@
-import json
 import os
 import random
 import re
-from typing import Dict, List, Set
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from knowledge_graph_service import KnowledgeGraphService
+from knowledge_graph_service import KnowledgeGraphService, build_graph
 from log import logger_factory
+from object_bundle import BUNDLE_DIRECTORY, fs_calls, load_bundle, stat_sources, write_bundle
+from search_index import SearchIndex
+from sprite_atlas import ATLAS_DIRECTORY, atlas_name, atlas_supported, get_atlas
+from vector_store import VectorStore
 
 logger = logger_factory.get_logger(__name__)
 
@@ -27,60 +31,449 @@ name_map = {
 }
 
 
+# images_square/<size>/ 下的多尺寸缩略图，未指定尺寸时优先使用的尺寸
+DEFAULT_SQUARE_SIZE = 256
+SQUARE_FORMATS = ("jpg", "webp")
+
+# images 目录下的分段文件：<segment>_<n>.jpg 为图片，<segment>_*.mp4 为视频
+SEGMENT_FILE_PATTERN = re.compile(r"^(\d+)_(?:(\d+\.jpg)|.*\.mp4)$")
+
+
 def get_name_en(name_zh: str):
     return name_map.get(name_zh) or name_zh
 
 
-class ObjectService:
+def get_object_name(directory: str):
+    # 物体目录名为 <名称>_<编号>
+    return directory.strip().split("_")[0]
+
+
+def group_segment_files(files: Iterable[str]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    # 一次遍历按 segment id 分组，组内保持输入顺序
+    images: Dict[str, List[str]] = dict()
+    videos: Dict[str, List[str]] = dict()
+    match = SEGMENT_FILE_PATTERN.match
+    for file in files:
+        m = match(file)
+        if m is None:
+            continue
+        bucket = images if m.group(2) is not None else videos
+        segment_files = bucket.get(m.group(1))
+        if segment_files is None:
+            bucket[m.group(1)] = [file]
+        else:
+            segment_files.append(file)
+    return images, videos
+
+
+class ObjectEntry:
+    # 单个物体目录的文件索引，扫描时构建一次，请求时只做字典查找
+    def __init__(self, path: str):
+        self.path = path
+        self.kg_file: Optional[str] = None
+        self.kg_en_file: Optional[str] = None
+        self.subtitle_zh_file: Optional[str] = None
+        self.subtitle_en_file: Optional[str] = None
+        self.vector_file: Optional[str] = None
+        # segment id -> 文件名列表，保持目录列举顺序
+        self.segment_images: Dict[str, List[str]] = dict()
+        self.segment_videos: Dict[str, List[str]] = dict()
+        self.square_urls: List[str] = []
+        # 格式 -> 尺寸 -> url 列表，由 central_crop_script.py 生成
+        self.square_variants: Dict[str, Dict[int, List[str]]] = dict()
+        # 预编译产物中的字幕：文件 -> (mtime_ns, size, 行)
+        self.preloaded_lines: Dict[str, Tuple[int, int, List[str]]] = dict()
+        # 图集名 -> (缩略图 url -> [图集 url, x, y, w, h])，第一次请求时加载或生成
+        self.sprites: Dict[str, Dict[str, list]] = dict()
+        # 避免并发请求重复生成同一物体的图集，不同物体的图集互不阻塞
+        self.sprites_lock = threading.Lock()
+
+    @classmethod
+    def scan(cls, path: str):
+        entry = cls(path)
+        fs_calls.inc("isdir")
+        if not os.path.isdir(path):
+            logger.warning("object path is not a directory: %s.", path)
+            return entry
+
+        fs_calls.inc("listdir")
+        for file in os.listdir(path):
+            if entry.kg_file is None and file.endswith("kg.json"):
+                entry.kg_file = f"{path}/{file}"
+            if entry.kg_en_file is None and file.endswith("kg_en.json"):
+                entry.kg_en_file = f"{path}/{file}"
+            if entry.subtitle_zh_file is None and file.endswith("structure-lang.txt"):
+                entry.subtitle_zh_file = f"{path}/{file}"
+            if entry.subtitle_en_file is None and file.endswith("structure-lang_en.txt"):
+                entry.subtitle_en_file = f"{path}/{file}"
+            if entry.vector_file is None and "vector" in file:
+                entry.vector_file = f"{path}/{file}"
+
+        path_images = f"{path}/images"
+        fs_calls.inc("isdir")
+        if os.path.isdir(path_images):
+            fs_calls.inc("listdir")
+            entry.segment_images, entry.segment_videos = group_segment_files(os.listdir(path_images))
+
+        path_square = f"{path}/images_square"
+        fs_calls.inc("isdir")
+        if os.path.isdir(path_square):
+            size_dirs = []
+            fs_calls.inc("scandir")
+            with os.scandir(path_square) as it:
+                for f in it:
+                    if f.name.endswith(".jpg") and f.is_file():
+                        url = f"{path_square}/{f.name}".replace(os.path.sep, "/")
+                        entry.square_urls.append(f"/{url}")
+                    elif f.name.isdigit() and f.is_dir():
+                        size_dirs.append(f.name)
+            for size in size_dirs:
+                fs_calls.inc("scandir")
+                with os.scandir(f"{path_square}/{size}") as it:
+                    for f in it:
+                        fmt = f.name.rsplit(".", 1)[-1]
+                        if fmt in SQUARE_FORMATS:
+                            url = f"{path_square}/{size}/{f.name}".replace(os.path.sep, "/")
+                            entry.square_variants.setdefault(fmt, dict()).setdefault(int(size), []).append(f"/{url}")
+
+        return entry
+
+    def get_square_urls(self, size: Optional[int] = None, fmt: str = "jpg") -> List[str]:
+        # 选择不小于 size 的最小尺寸，没有则取最大尺寸；没有多尺寸版本时退回原来的 256 裁剪图
+        variants = self.square_variants.get(fmt)
+        if not variants or (size is None and fmt == "jpg"):
+            return self.square_urls
+        sizes = sorted(variants)
+        wanted = size or DEFAULT_SQUARE_SIZE
+        chosen = next((s for s in sizes if s >= wanted), sizes[-1])
+        return variants[chosen]
+
+    def square_url_groups(self) -> List[Tuple[List[str], str]]:
+        # 每组为同一目录下同一格式的缩略图，对应一个图集
+        groups = [(self.square_urls, "jpg")]
+        for fmt, sizes in self.square_variants.items():
+            groups.extend((urls, fmt) for urls in sizes.values())
+        return [(urls, fmt) for urls, fmt in groups if urls]
+
+    def source_files(self) -> List[str]:
+        files = [self.kg_file, self.kg_en_file, self.subtitle_zh_file, self.subtitle_en_file, self.vector_file]
+        return [f for f in files if f]
+
+    def relative_name(self, file: Optional[str]) -> Optional[str]:
+        return file[len(self.path) + 1:] if file else None
+
+    def absolute_name(self, name: Optional[str]) -> Optional[str]:
+        return f"{self.path}/{name}" if name else None
+
+    def to_bundle(self) -> Dict:
+        # 只保存相对物体目录的文件名，物体目录移动后产物仍然可用
+        square_prefix = len(f"/{self.path}/images_square/".replace(os.path.sep, "/"))
+        return {
+            "kg_file": self.relative_name(self.kg_file),
+            "kg_en_file": self.relative_name(self.kg_en_file),
+            "subtitle_zh_file": self.relative_name(self.subtitle_zh_file),
+            "subtitle_en_file": self.relative_name(self.subtitle_en_file),
+            "vector_file": self.relative_name(self.vector_file),
+            "segment_images": self.segment_images,
+            "segment_videos": self.segment_videos,
+            "square_urls": [url[square_prefix:] for url in self.square_urls],
+            "square_variants": {fmt: {str(size): [url[square_prefix:] for url in urls] for size, urls in sizes.items()}
+                                for fmt, sizes in self.square_variants.items()},
+        }
+
+    @classmethod
+    def from_bundle(cls, path: str, data: Dict):
+        entry = cls(path)
+        entry.kg_file = entry.absolute_name(data["kg_file"])
+        entry.kg_en_file = entry.absolute_name(data["kg_en_file"])
+        entry.subtitle_zh_file = entry.absolute_name(data["subtitle_zh_file"])
+        entry.subtitle_en_file = entry.absolute_name(data["subtitle_en_file"])
+        entry.vector_file = entry.absolute_name(data["vector_file"])
+        entry.segment_images = data["segment_images"]
+        entry.segment_videos = data["segment_videos"]
+        square_prefix = f"/{path}/images_square/".replace(os.path.sep, "/")
+        entry.square_urls = [square_prefix + name for name in data["square_urls"]]
+        entry.square_variants = {fmt: {int(size): [square_prefix + name for name in names]
+                                       for size, names in sizes.items()}
+                                 for fmt, sizes in data["square_variants"].items()}
+        return entry
+
+
+def inventory_directories(path: str) -> List[str]:
+    # 决定文件清单的目录（相对路径），目录 mtime 变化说明有文件增删
+    directories = [""]
+    for directory in ("images", "images_square"):
+        fs_calls.inc("isdir")
+        if os.path.isdir(f"{path}/{directory}"):
+            directories.append(directory)
+    if "images_square" in directories:
+        fs_calls.inc("scandir")
+        with os.scandir(f"{path}/images_square") as it:
+            directories.extend(f"images_square/{f.name}" for f in it if f.name.isdigit() and f.is_dir())
+    return directories
+
+
+def directory_stamp(path: str) -> Tuple:
+    # 清单子目录的 mtime 及顶层文件的 (mtime, size)；不变时说明文件清单和源文件都没有变化，
+    # 重新加载时可以沿用旧的 ObjectEntry 和搜索索引。物体目录本身的 mtime 不计入：
+    # 顶层文件的增删已由文件列表体现，而首次生成 .cache 也会改变它
+    directories = [directory for directory in inventory_directories(path) if directory]
+    stamp = [(name, mtime_ns) for name, mtime_ns, _ in stat_sources(path, directories)]
+    fs_calls.inc("scandir")
+    with os.scandir(path) as it:
+        for f in it:
+            if f.is_file():
+                # is_file 使用目录项中的类型，不需要系统调用；stat 需要
+                fs_calls.inc("stat")
+                stat = f.stat()
+                stamp.append((f.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stamp))
+
+
+class Catalog:
+    # 某一时刻的物体索引，发布后只读；重新加载时构建新的实例并整体替换引用，请求不会看到构建了一半的索引
     def __init__(self, base_directory: str):
         self.base_directory = base_directory
         self.object_paths: Dict[str, List[str]] = dict()
         self.object_names: Set[str] = set()
         self.object_alias: Dict[str, List[str]] = dict()
+        # object path -> ObjectEntry
+        self.entries: Dict[str, ObjectEntry] = dict()
+        # object path -> directory_stamp
+        self.stamps: Dict[str, Tuple] = dict()
+
+    def add(self, name: str, path: str, entry: ObjectEntry, stamp: Tuple):
+        self.object_names.add(name)
+        self.object_paths.setdefault(name, []).append(path)
+        self.entries[path] = entry
+        self.stamps[path] = stamp
+
+    def names_of(self, paths: Iterable[str]) -> Set[str]:
+        return {get_object_name(os.path.basename(path)) for path in paths}
+
+
+class ObjectService:
+    def __init__(self, base_directory: str):
+        self.base_directory = base_directory
+        self.catalog = Catalog(base_directory)
+        # 同一时间只有一次重新加载
+        self.reload_lock = threading.Lock()
 
         self.knowledge_graph_service = KnowledgeGraphService()
+        self.vector_store = VectorStore()
+        # 图谱节点和字幕的全文索引，随物体目录增量更新
+        self.search_index = SearchIndex()
+
+        self.reload()
 
-        self._scan()
+    @property
+    def object_paths(self) -> Dict[str, List[str]]:
+        return self.catalog.object_paths
+
+    @property
+    def object_names(self) -> Set[str]:
+        return self.catalog.object_names
 
     def set_base_directory(self, base_directory: str):
         self.base_directory = base_directory
-        self.object_paths: Dict[str, List[str]] = dict()
-        self.object_names: Set[str] = set()
-        self.object_alias: Dict[str, List[str]] = dict()
-        self._scan()
-
-    def _scan(self):
-        logger.debug(f"scanning directory {self.base_directory}.")
+        self.reload()
+
+    def reload(self) -> Set[str]:
+        # 在调用线程中构建新的索引，只重新扫描目录清单有变化的物体，完成后一次性替换；
+        # 返回新增、变化或删除的物体名称，调用方据此清理响应缓存
+        with self.reload_lock:
+            old = self.catalog
+            new = self._scan(old)
+            removed = [path for path in old.entries if path not in new.entries]
+            changed = new.names_of(path for path in new.entries if old.entries.get(path) is not new.entries[path])
+            changed |= old.names_of(removed)
+            self.catalog = new
+            for path in removed:
+                self._invalidate_entry(old.entries[path])
+                self.search_index.remove(path)
+        if changed:
+            logger.info("reloaded %s: %d objects, changed: %s.", new.base_directory, len(new.object_names),
+                        ", ".join(sorted(changed)))
+        return changed
+
+    def _scan(self, old: Catalog) -> Catalog:
+        catalog = Catalog(self.base_directory)
+        logger.debug("scanning directory %s.", self.base_directory)
+        fs_calls.inc("exists")
         if not self.base_directory or not os.path.exists(self.base_directory):
             logger.error("the directory to be scanned does not exist.")
-            return
-        files = os.listdir(self.base_directory)
+            return catalog
+        fs_calls.inc("scandir")
+        with os.scandir(self.base_directory) as it:
+            # .DS_Store、Thumbs.db 等文件不是物体目录，直接跳过
+            files = [f.name for f in it if f.is_dir()]
         for file in files:
-            name = file.strip().split("_")[0]
+            name = get_object_name(file)
             path: str = f"{self.base_directory}/{file}"
-            self.object_names.add(name)
-            if self.object_paths.get(name) is None:
-                self.object_paths[name] = []
-            self.object_paths[name].append(path)
-        logger.debug(f"scanning directory {self.base_directory} finish.")
+            entry = old.entries.get(path)
+            try:
+                stamp = directory_stamp(path)
+                if entry is None or old.stamps[path] != stamp:
+                    if entry is not None:
+                        self._invalidate_entry(entry)
+                    entry = self._load_entry(name, path)
+                    self._index_entry(name, entry)
+            except OSError as ex:
+                # 正在复制或删除的目录，保留旧的索引（如果有），下次重新加载时再处理
+                logger.warning("can not scan %s: %s.", path, ex)
+                if entry is None:
+                    continue
+                stamp = old.stamps[path]
+            catalog.add(name, path, entry, stamp)
+        logger.debug("scanning directory %s finish.", self.base_directory)
+        return catalog
+
+    def _invalidate_entry(self, entry: ObjectEntry):
+        for file in (entry.kg_file, entry.kg_en_file):
+            if file:
+                self.knowledge_graph_service.cache.invalidate(file)
+        if entry.vector_file:
+            self.vector_store.invalidate(entry.vector_file)
+
+    def _index_entry(self, name: str, entry: ObjectEntry):
+        # 图谱节点以节点 id、字幕以行号为文档；读取失败时该物体仍可访问，只是搜索不到
+        docs = []
+        try:
+            for lang, file in (("zh", entry.kg_file), ("en", entry.kg_en_file)):
+                if file:
+                    for node in self.knowledge_graph_service.get_graph_index(name, file).graph["nodes"]:
+                        text = node["data"]["text"]
+                        if lang == "en" and node["id"] == "0":
+                            text = get_name_en(text)
+                        docs.append(("node", node["id"], lang, text))
+            for lang, file in (("zh", entry.subtitle_zh_file), ("en", entry.subtitle_en_file)):
+                if file:
+                    lines = self._read_lines(entry, file)
+                    docs.extend(("segment", str(i), lang, line) for i, line in enumerate(lines))
+        except (OSError, ValueError) as ex:
+            logger.warning("can not index %s: %r.", entry.path, ex)
+        self.search_index.update(entry.path, docs)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        # node 的 id 为图谱节点 id，segment 的 id 与 get_images_and_subtitles 的分段 id 一致
+        catalog = self.catalog
+        res = []
+        for score, path, kind, key, lang, snippet in self.search_index.search(query, limit):
+            if path not in catalog.entries:
+                # 正在重新加载，索引已更新但新的物体索引还没有发布
+                continue
+            name = get_object_name(os.path.basename(path))
+            if kind == "segment":
+                key = f"{catalog.object_paths[name].index(path)}{key}"
+            res.append({"object_name": name, "type": kind, "id": key, "lang": lang, "snippet": snippet,
+                        "score": round(score, 4)})
+        return res
 
     def get_object_names(self):
-        return self.object_names
-
-    def get_knowledge_graph_data(self, name: str):
-        object_path = random.choice(self.object_paths[name])
-        files = os.listdir(object_path)
-
-        kg_files = list(filter(lambda x: str.endswith(x, "kg.json"), files))
-        if kg_files:
-            file = f"{object_path}/{kg_files[0]}"
-            return self.knowledge_graph_service.get_graph_data(name, file)
+        return self.catalog.object_names
+
+    def _entry(self, path: str) -> ObjectEntry:
+        entry = self.catalog.entries.get(path)
+        if entry is None:
+            # 取得路径后索引被替换（目录已删除），按需扫描，不修改已发布的索引
+            entry = ObjectEntry.scan(path)
+        return entry
+
+    def _load_entry(self, name: str, path: str) -> ObjectEntry:
+        # 有最新的预编译产物时直接使用（图谱放入缓存、字幕放入内存），否则扫描原始文件
+        bundle = load_bundle(path)
+        if bundle is None:
+            return ObjectEntry.scan(path)
+        entry = ObjectEntry.from_bundle(path, bundle["entry"])
+        stats = {source: (mtime_ns, size) for source, mtime_ns, size in bundle["sources"]}
+        for key in ("kg_file", "kg_en_file"):
+            graph = bundle["graphs"].get(key)
+            relative = bundle["entry"][key]
+            if graph is not None:
+                mtime_ns, size = stats[relative]
+                self.knowledge_graph_service.put_graph(name, f"{path}/{relative}", mtime_ns, size, graph)
+        for relative, lines in bundle["subtitles"].items():
+            mtime_ns, size = stats[relative]
+            entry.preloaded_lines[f"{path}/{relative}"] = (mtime_ns, size, lines)
+        return entry
+
+    def compile_bundles(self, force: bool = False) -> Tuple[int, int, int]:
+        # 把每个物体目录编译为一个预编译产物，返回 (编译数, 已是最新数, 失败数)
+        compiled = skipped = failed = 0
+        for name, paths in self.catalog.object_paths.items():
+            for path in paths:
+                if not force and load_bundle(path) is not None:
+                    skipped += 1
+                    continue
+                try:
+                    self._compile_bundle(name, path)
+                    compiled += 1
+                except Exception as ex:
+                    logger.error("can not compile %s: %r.", path, ex)
+                    failed += 1
+        return compiled, skipped, failed
+
+    def _compile_bundle(self, name: str, path: str):
+        # 先创建产物目录再记录目录 mtime；先记录源文件状态再读取内容，编译期间被修改的文件会使产物过期
+        os.makedirs(f"{path}/{BUNDLE_DIRECTORY}", exist_ok=True)
+        entry = ObjectEntry.scan(path)
+        sources = inventory_directories(path) + [entry.relative_name(f) for f in entry.source_files()]
+        stats = stat_sources(path, sources)
+
+        graphs = dict()
+        for key, file in (("kg_file", entry.kg_file), ("kg_en_file", entry.kg_en_file)):
+            if file:
+                graphs[key] = build_graph(name, self.knowledge_graph_service.read_raw_data(file))
+        subtitles = dict()
+        for file in (entry.subtitle_zh_file, entry.subtitle_en_file):
+            if file:
+                subtitles[entry.relative_name(file)] = self.read_all_lines(file)
+        if entry.vector_file:
+            # 二进制向量由 VectorStore 转换为 .cache/vectors.npy，运行时以 mmap 方式读取
+            self.vector_store.get(entry.vector_file)
+
+        write_bundle(path, {"name": name, "sources": stats, "entry": entry.to_bundle(), "graphs": graphs,
+                            "subtitles": subtitles})
+        if atlas_supported():
+            for urls, fmt in entry.square_url_groups():
+                self.get_sprites(entry, urls, fmt)
+        logger.info("compiled %s.", path)
+
+    def get_source_version(self, name: str):
+        # 物体目录清单和源文件的 (mtime, size)，用于判断预编码的响应是否过期
+        catalog = self.catalog
+        version = []
+        for path in catalog.object_paths[name]:
+            version.append(catalog.stamps[path])
+            for file in catalog.entries[path].source_files():
+                fs_calls.inc("stat")
+                try:
+                    stat = os.stat(file)
+                    version.append((stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    version.append(None)
+        return tuple(version)
+
+    def _kg_entry(self, name: str, partial: bool) -> ObjectEntry:
+        # 分层加载和展开的请求需要落在同一份图谱上，固定使用第一个目录
+        paths = self.object_paths[name]
+        return self._entry(paths[0] if partial else random.choice(paths))
+
+    def get_knowledge_graph_data(self, name: str, depth: Optional[int] = None, branch: Optional[str] = None,
+                                 expand: Optional[str] = None):
+        partial = depth is not None or branch is not None or expand is not None
+        entry = self._kg_entry(name, partial)
+        if entry.kg_file:
+            return self.knowledge_graph_service.get_graph_data(name, entry.kg_file, depth, branch, expand)
 
         return None
 
-    def get_knowledge_graph_data_ex(self, name: str):
-        object_path = random.choice(self.object_paths[name])
-        files = os.listdir(object_path)
+    def get_knowledge_graph_data_ex(self, name: str, image_size: Optional[int] = None, image_format: str = "jpg",
+                                    depth: Optional[int] = None, branch: Optional[str] = None,
+                                    expand: Optional[str] = None, positions: bool = False, atlas: bool = False):
+        partial = depth is not None or branch is not None or expand is not None
+        entry = self._kg_entry(name, partial)
+        object_path = entry.path
         res = {
             "shape": dict(),
             "zh": dict(),
@@ -88,56 +481,102 @@ class ObjectService:
             "image": dict()
         }
 
-        files_zh = list(filter(lambda x: str.endswith(x, "kg.json"), files))
-        if not files_zh:
-            logger.error(f"knowledge graph file not found in {object_path}.")
+        if not entry.kg_file:
+            logger.error("knowledge graph file not found in %s.", object_path)
             return None
 
-        file = f"{object_path}/{files_zh[0]}"
-        shape = self.knowledge_graph_service.get_graph_data(name, file)
+        shape = self.knowledge_graph_service.get_graph_data(name, entry.kg_file, depth, branch, expand)
+        if positions:
+            # 服务端预先计算的布局坐标，部分加载时与完整图的坐标一致
+            kg_index = self.knowledge_graph_service.get_graph_index(name, entry.kg_file)
+            res["positions"] = kg_index.positions([node["id"] for node in shape["nodes"]])
         for node in shape["nodes"]:
             res["zh"].update({node["id"]: node["data"]["text"]})
         for node in shape["nodes"]:
             del node["data"]["text"]
         res["shape"] = shape
 
-        files_en = list(filter(lambda x: str.endswith(x, "kg_en.json"), files))
-        if not files_en:
-            logger.error(f"knowledge graph en file not found in {object_path}.")
+        if not entry.kg_en_file:
+            logger.error("knowledge graph en file not found in %s.", object_path)
             return res
 
-        file = f"{object_path}/{files_en[0]}"
-        res_en = self.knowledge_graph_service.get_graph_data(name, file)
-        for node in res_en["nodes"]:
+        if partial:
+            # 只取返回的节点对应的英文，按 id 直接查找，不复制整张图
+            en_index = self.knowledge_graph_service.get_graph_index(name, entry.kg_en_file)
+            en_nodes = [n for n in (en_index.node(node["id"]) for node in shape["nodes"]) if n is not None]
+        else:
+            en_nodes = self.knowledge_graph_service.get_graph_data(name, entry.kg_en_file)["nodes"]
+        for node in en_nodes:
             if node["id"] == '0':
                 res["en"].update({node["id"]: get_name_en(node["data"]["text"])})
             else:
                 res["en"].update({node["id"]: node["data"]["text"]})
 
-        images = self.get_knowledge_image_urls(name)
+        images, sprites = self.get_knowledge_images(name, image_size, image_format, atlas)
+        if atlas:
+            res["sprite"] = dict()
         for node in shape["nodes"]:
-            res["image"].update({node["id"]: random.choice(images)})
+            image = random.choice(images)
+            res["image"].update({node["id"]: image})
+            if atlas:
+                # 图集中的位置 [图集 url, x, y, w, h]，图集不可用时为 null，使用 image
+                res["sprite"][node["id"]] = sprites.get(image)
 
         return res
 
-    def get_knowledge_image_urls(self, name: str):
-        object_path = random.choice(self.object_paths[name])
-        path = f"{object_path}/images_square"
-        if not object_path or not os.path.exists(path) or not os.path.isdir(path):
-            logger.error(f"directory not found: {path}.")
-            return []
-
-        files = list(filter(lambda x: str.endswith(x, ".jpg"), os.listdir(path)))
-        urls = []
-        for file in files:
-            file_path: str = f"{path}/{file}".replace("/", os.path.sep)
-            if os.path.exists(file_path):
-                url = file_path.replace(os.path.sep, "/")
-                urls.append(f"/{url}")
-        return urls
+    def get_knowledge_image_urls(self, name: str, size: Optional[int] = None, fmt: str = "jpg"):
+        return self.get_knowledge_images(name, size, fmt)[0]
+
+    def get_knowledge_images(self, name: str, size: Optional[int] = None, fmt: str = "jpg",
+                             atlas: bool = False) -> Tuple[List[str], Dict[str, list]]:
+        # 缩略图 url 列表；atlas 时同时返回 url -> 图集位置
+        entry = self._entry(random.choice(self.object_paths[name]))
+        urls = entry.get_square_urls(size, fmt)
+        if not urls:
+            logger.error("directory not found: %s/images_square.", entry.path)
+            return [], dict()
+        return urls[:], self.get_sprites(entry, urls, fmt) if atlas else dict()
+
+    def get_sprites(self, entry: ObjectEntry, urls: List[str], fmt: str) -> Dict[str, list]:
+        # urls 为同一目录下的缩略图；没有 Pillow 且没有已生成的图集，或生成失败时为空，生成失败的结果不缓存，下次请求重试
+        prefix = f"/{entry.path}/".replace(os.path.sep, "/")
+        files = [url[len(prefix):] for url in urls]
+        name = atlas_name(os.path.dirname(files[0]), fmt)
+        sprites = entry.sprites.get(name)
+        if sprites is not None:
+            return sprites
+        with entry.sprites_lock:
+            sprites = entry.sprites.get(name)
+            if sprites is None:
+                try:
+                    manifest = get_atlas(entry.path, files, name, fmt)
+                except (OSError, ValueError) as ex:
+                    logger.warning("can not build atlas %s for %s: %r.", name, entry.path, ex)
+                    return dict()
+                sprites = dict()
+                if manifest is not None:
+                    sheet_prefix = f"{prefix}{ATLAS_DIRECTORY}/"
+                    sheets = manifest["sheets"]
+                    for file, (sheet, x, y, w, h) in manifest["tiles"].items():
+                        sprites[prefix + file] = [sheet_prefix + sheets[sheet], x, y, w, h]
+                entry.sprites[name] = sprites
+        return sprites
+
+    def _read_lines(self, entry: ObjectEntry, filename: str):
+        preloaded = entry.preloaded_lines.get(filename)
+        if preloaded is not None:
+            fs_calls.inc("stat")
+            try:
+                stat = os.stat(filename)
+                if (stat.st_mtime_ns, stat.st_size) == preloaded[:2]:
+                    return preloaded[2][:]
+            except OSError:
+                pass
+        return self.read_all_lines(filename)
 
     def read_all_lines(self, filename: str):
         res = []
+        fs_calls.inc("open")
         with open(filename, "r", encoding="utf-8") as file:
             lines = file.readlines()
             for line in lines:
@@ -147,22 +586,18 @@ class ObjectService:
         return res
 
     def _get_images_and_subtitles(self, object_path: str):
-        # 获取字幕
-        files_in_object_path = os.listdir(object_path)
+        entry = self._entry(object_path)
 
-        filtered = list(filter(lambda x: str.endswith(x, "structure-lang.txt"), files_in_object_path))
-        if not filtered:
-            logger.error(f"subtitle file zh not found in {object_path}.")
+        # 获取字幕
+        if not entry.subtitle_zh_file:
+            logger.error("subtitle file zh not found in %s.", object_path)
             return []
-        subtitle_file_zh = filtered[0]
-        subtitle_lines_zh = self.read_all_lines(f"{object_path}/{subtitle_file_zh}")
+        subtitle_lines_zh = self._read_lines(entry, entry.subtitle_zh_file)
 
-        filtered = list(filter(lambda x: str.endswith(x, "structure-lang_en.txt"), files_in_object_path))
-        if not filtered:
-            logger.error(f"subtitle file zh not found in {object_path}.")
+        if not entry.subtitle_en_file:
+            logger.error("subtitle file en not found in %s.", object_path)
             return []
-        subtitle_file_en = filtered[0]
-        subtitle_lines_en = self.read_all_lines(f"{object_path}/{subtitle_file_en}")
+        subtitle_lines_en = self._read_lines(entry, entry.subtitle_en_file)
 
         if len(subtitle_lines_zh) != len(subtitle_lines_en):
             logger.warning("line count is not equal.")
@@ -171,22 +606,13 @@ class ObjectService:
                     subtitle_lines_en.append("")
 
         path_images = f"{object_path}/images"
-        files_in_images = os.listdir(path_images)
-
         segment_count = len(subtitle_lines_zh)
 
         segments = []
         for i in range(segment_count):
             segment_id = str(i)
-            segment_images = []
-            segment_videos = []
-            for f in files_in_images:
-                m = re.match(rf"^{segment_id}_\d+\.jpg$", f)
-                if m is not None:
-                    segment_images.append(m.string)
-                m = re.match(rf"^{segment_id}_.*\.mp4$", f)
-                if m is not None:
-                    segment_videos.append(m.string)
+            segment_images = entry.segment_images.get(segment_id)
+            segment_videos = entry.segment_videos.get(segment_id)
 
             if not segment_images:
                 continue
@@ -216,19 +642,23 @@ class ObjectService:
             for seg in current_segments:
                 seg["id"] = f"{i}{seg['id']}"
             segments.extend(current_segments)
-        print(json.dumps(segments))
         return segments
 
     def get_vectors(self, name: str):
-        object_path = random.choice(self.object_paths[name])
-        files = os.listdir(object_path)
-        res = list(filter(lambda x: "vector" in x, files))
-        if res:
-            file_path = f"{object_path}/{res[0]}"
-            with open(file_path, "r", encoding="utf-8") as file:
+        entry = self._entry(random.choice(self.object_paths[name]))
+        if entry.vector_file:
+            fs_calls.inc("open")
+            with open(entry.vector_file, "r", encoding="utf-8") as file:
                 return file.read()
         return None
 
+    def get_vector_array(self, name: str):
+        # 向量的位数组，首次访问时转换并缓存到磁盘，之后以 mmap 方式读取
+        entry = self._entry(random.choice(self.object_paths[name]))
+        if entry.vector_file:
+            return self.vector_store.get(entry.vector_file)
+        return None
+
 
 if __name__ == '__main__':
     service = ObjectService("static/objects")
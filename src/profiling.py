@@ -0,0 +1,179 @@
+import cProfile
+import functools
+import inspect
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from log import logger_factory
+
+logger = logger_factory.get_logger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+# 按需性能分析，只在 Config.profiling_enabled 为 true 时由 install 接入，关闭时请求路径上没有任何额外代码。
+# 单个请求：?profile=1 或请求头 X-Profile，cProfile 结果写入 profiling_directory，文件名在响应头 X-Profile 中返回；
+# 全局采样：Sampler 定时读取所有线程（事件循环和线程池）的调用栈，输出 collapsed stack 格式，可直接生成火焰图
+
+# 被分析的请求在线程池中各段调用的 cProfile，通过 contextvars 传到线程池
+current_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("current_profiles", default=None)
+file_counter = itertools.count()
+
+
+def profile_calls(func):
+    # cProfile 只记录调用 enable 的线程，同步接口在线程池中运行，需要在线程内单独记录
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiles = current_profiles.get()
+        if profiles is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 起 cProfile 对所有线程生效，事件循环线程中的 profile 已经记录了这里的调用
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            profiles.append(profile)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def wants_profile(scope: Scope) -> bool:
+    if any(key == PROFILE_HEADER for key, _ in scope["headers"]):
+        return True
+    for part in scope["query_string"].split(b"&"):
+        if part in (b"profile=1", b"profile=true"):
+            return True
+    return False
+
+
+def profile_file_name(scope: Scope) -> str:
+    route = scope["path"].strip("/").replace("/", "_") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}_{next(file_counter)}_{route}.prof"
+
+
+class ProfileMiddleware:
+    # 纯 ASGI 中间件，套在整个中间件栈外层
+    def __init__(self, app: ASGIApp, directory: str):
+        self.app = app
+        self.directory = directory
+        # 事件循环线程同时只能有一个 cProfile，并发的被分析请求按普通请求处理
+        self.busy = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if self.busy:
+            await self.app(scope, receive, self.with_header(send, b"busy"))
+            return
+
+        name = profile_file_name(scope)
+        profiles: List[cProfile.Profile] = []
+        profile = cProfile.Profile()
+        token = current_profiles.set(profiles)
+        self.busy = True
+        profile.enable()
+        try:
+            await self.app(scope, receive, self.with_header(send, name.encode("latin-1")))
+        finally:
+            profile.disable()
+            self.busy = False
+            current_profiles.reset(token)
+        # 事件循环线程的 profile 也包含同时处理的其他请求的协程
+        await run_in_threadpool(self.dump, [profile] + profiles, name)
+        logger.info("profile of %s %s written to %s.", scope["method"], scope["path"], name)
+
+    @staticmethod
+    def with_header(send: Send, value: bytes) -> Send:
+        async def send_with_header(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_HEADER, value)]
+            await send(message)
+
+        return send_with_header
+
+    def dump(self, profiles: List[cProfile.Profile], name: str):
+        os.makedirs(self.directory, exist_ok=True)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(os.path.join(self.directory, name))
+
+
+def install(app, directory: str):
+    # 在 lifespan 中调用：包装同步接口（线程池中运行）并在已构建的中间件栈外层加上 ProfileMiddleware；可重复调用
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        call = getattr(dependant, "call", None)
+        if call is None or inspect.iscoroutinefunction(call) or getattr(call, "profiled", False):
+            continue
+        dependant.call = profile_calls(call)
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    if isinstance(app.middleware_stack, ProfileMiddleware):
+        app.middleware_stack.directory = directory
+    else:
+        app.middleware_stack = ProfileMiddleware(app.middleware_stack, directory)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+
+class Sampler:
+    # 采样线程每隔 interval 秒记录一次所有线程的调用栈，结束后写出 "线程;外层函数;...;内层函数 次数" 格式的文件
+    def __init__(self):
+        self.thread: Optional[threading.Thread] = None
+
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds: float, interval: float, directory: str) -> str:
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{next(file_counter)}_sampled.collapsed"
+        self.thread = threading.Thread(target=self.run, args=(seconds, interval, os.path.join(directory, name)),
+                                       name="profiling sampler", daemon=True)
+        self.thread.start()
+        return name
+
+    def run(self, seconds: float, interval: float, path: str):
+        own = threading.get_ident()
+        counts: Dict[str, int] = dict()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":").replace(" ", "_"))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            for key, count in sorted(counts.items()):
+                file.write(f"{key} {count}\n")
+        os.replace(tmp, path)
+        logger.info("sampled %d stacks in %d samples, written to %s.", len(counts), samples, path)
@@ -0,0 +1,203 @@
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 英文和数字按词切分，中文（CJK 统一表意文字）按字切分
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+SNIPPET_LENGTH = 60
+# 候选文档不超过该数量时逐个检查整句命中，否则对全部文本查找一次
+PHRASE_SCAN_THRESHOLD = 256
+
+
+def is_cjk(run: str) -> bool:
+    return run[0] >= "\u3400"
+
+
+def tokenize(text: str) -> List[str]:
+    # 建索引用：中文同时生成一元和二元 n-gram，单字查询也能命中
+    terms = []
+    for run in TOKEN_PATTERN.findall(text.lower()):
+        if not is_cjk(run):
+            terms.append(run)
+        else:
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(query: str) -> List[str]:
+    # 查询用：中文只取二元（单字时取一元），去重后词越少求交越快
+    terms = []
+    for run in TOKEN_PATTERN.findall(query.lower()):
+        if not is_cjk(run) or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def make_snippet(text: str, needle: str) -> str:
+    # 截取命中位置附近的文本
+    if len(text) <= SNIPPET_LENGTH:
+        return text
+    pos = max(text.lower().find(needle), 0)
+    start = max(0, min(pos - SNIPPET_LENGTH // 3, len(text) - SNIPPET_LENGTH))
+    end = start + SNIPPET_LENGTH
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+def contains(posting: array, doc_id: int) -> bool:
+    i = bisect_left(posting, doc_id)
+    return i < len(posting) and posting[i] == doc_id
+
+
+class SearchIndex:
+    # 倒排索引：词 -> 升序文档号（array('I')）。文档号只增不减，更新物体时旧文档标记删除，删除过半时重新编号
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # 清空索引数据；锁保持不变，重新编号时等待中的查询仍然和更新互斥
+        self.postings: Dict[str, array] = dict()
+        # 文档号 -> (物体目录, 类型, id, 语言, 文本)，None 为已删除
+        self.docs: List[Optional[Tuple[str, str, str, str, str]]] = []
+        # 文档号 -> 长度权重，短文本优先；已删除为 0
+        self.norms = array("f")
+        # 所有文档的小写文本，每个文档后接一个换行，整句匹配时对整段文本做一次查找；新增的文档先放在 pending 中
+        self.text = ""
+        self.pending: List[str] = []
+        self.text_length = 0
+        # 文档号 -> 在 text 中的起始位置
+        self.offsets = array("I")
+        # 物体目录 -> 文档号区间
+        self.ranges: Dict[str, range] = dict()
+        self.deleted = 0
+        # 排序的词表，前缀匹配时使用，索引变化后重新生成
+        self.sorted_terms: Optional[List[str]] = None
+
+    def update(self, path: str, docs: List[Tuple[str, str, str, str]]):
+        # docs 为 (类型, id, 语言, 文本)，替换该物体目录之前的全部文档
+        with self.lock:
+            self._remove(path)
+            self._add(path, docs)
+            self._maybe_compact()
+
+    def remove(self, path: str):
+        with self.lock:
+            self._remove(path)
+            self._maybe_compact()
+
+    def _add(self, path: str, docs: List[Tuple[str, str, str, str]]):
+        start = len(self.docs)
+        for doc_id, (kind, key, lang, text) in enumerate(docs, start):
+            self.docs.append((path, kind, key, lang, text))
+            self.norms.append(1 / math.log2(2 + len(text)))
+            lowered = text.lower().replace("\n", " ") + "\n"
+            self.offsets.append(self.text_length)
+            self.pending.append(lowered)
+            self.text_length += len(lowered)
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = array("I")
+                posting.append(doc_id)
+        self.ranges[path] = range(start, len(self.docs))
+        self.sorted_terms = None
+
+    def _remove(self, path: str):
+        for doc_id in self.ranges.pop(path, ()):
+            self.docs[doc_id] = None
+            self.norms[doc_id] = 0.0
+            self.deleted += 1
+
+    def _maybe_compact(self):
+        if self.deleted * 2 <= len(self.docs):
+            return
+        live = [(path, [self.docs[i][1:] for i in ids]) for path, ids in self.ranges.items()]
+        self._reset()
+        for path, docs in live:
+            self._add(path, docs)
+
+    def _term_mask(self, term: str, prefix: bool) -> Optional[np.ndarray]:
+        # 调用方持有锁；包含该词（prefix 时为以该词开头的任意词）的文档
+        if prefix:
+            if self.sorted_terms is None:
+                self.sorted_terms = sorted(self.postings)
+            terms = self.sorted_terms
+            i = bisect_left(terms, term)
+            matched = []
+            while i < len(terms) and terms[i].startswith(term):
+                matched.append(self.postings[terms[i]])
+                i += 1
+        else:
+            matched = [self.postings[term]] if term in self.postings else []
+        if not matched:
+            return None
+        mask = np.zeros(len(self.docs), dtype=bool)
+        for posting in matched:
+            mask[np.frombuffer(posting, dtype=np.uint32)] = True
+        return mask
+
+    def _phrase_mask(self, needle: str, candidates: np.ndarray) -> np.ndarray:
+        # 调用方持有锁；候选文档中文本包含 needle 的位置
+        if self.pending:
+            self.text += "".join(self.pending)
+            self.pending = []
+        if "\n" in needle:
+            return np.zeros(len(candidates), dtype=bool)
+        offsets = np.frombuffer(self.offsets, dtype=np.uint32)
+        if len(candidates) <= PHRASE_SCAN_THRESHOLD:
+            text, ends = self.text, offsets.tolist()[1:] + [self.text_length]
+            return np.array([needle in text[offsets[i]:ends[i]] for i in candidates.tolist()], dtype=bool)
+        # 候选很多时对整段文本查找一次，由各段长度推算命中的起始位置，再换算为文档号
+        lengths = np.fromiter(map(len, self.text.split(needle)), dtype=np.int64)[:-1]
+        starts = np.cumsum(lengths) + np.arange(len(lengths)) * len(needle)
+        found = np.zeros(len(self.docs), dtype=bool)
+        found[np.searchsorted(offsets, starts, side="right") - 1] = True
+        return found[candidates]
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, str, str, str, str, str]]:
+        # 所有查询词都出现的文档，整句命中的分数加倍，短文本优先，分数乘以查询词的 idf 之和；
+        # 返回 (分数, 物体目录, 类型, id, 语言, 摘要)
+        terms = query_terms(query)
+        if not terms:
+            return []
+        needle = query.strip().lower()
+        # 最后一个英文词或数字按前缀匹配（还没输入完的词），查询以空格结尾时按整词匹配
+        prefix = not is_cjk(terms[-1]) and not query[-1].isspace()
+        with self.lock:
+            # numpy 视图引用着 array 的缓冲区，必须在释放锁之前用完，否则之后追加文档会失败
+            top = self._top(terms, prefix, needle, limit)
+        return [(score, path, kind, key, lang, make_snippet(text, needle if phrase else terms[0]))
+                for score, (path, kind, key, lang, text), phrase in top]
+
+    def _top(self, terms: List[str], prefix: bool, needle: str, limit: int):
+        norms = np.frombuffer(self.norms, dtype=np.float32)
+        # 已删除的文档权重为 0
+        mask = norms > 0
+        total = int(mask.sum())
+        idf = 0.0
+        for i, term in enumerate(terms):
+            term_mask = self._term_mask(term, prefix and i == len(terms) - 1)
+            if term_mask is None:
+                return []
+            idf += math.log(1 + total / max(int(term_mask.sum()), 1))
+            mask &= term_mask
+        candidates = np.flatnonzero(mask)
+
+        # 只有一个查询词且就是查询本身时，候选都是整句命中
+        if len(terms) == 1 and needle == terms[0]:
+            phrase = np.ones(len(candidates), dtype=bool)
+        else:
+            phrase = self._phrase_mask(needle, candidates)
+        scores = norms[candidates] * (1 + phrase) * idf
+        # 分数相同时文档号小的在前
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [(score, self.docs[doc_id], is_phrase) for score, doc_id, is_phrase in
+                zip(scores[order].tolist(), candidates[order].tolist(), phrase[order].tolist())]
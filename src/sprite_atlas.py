@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from http_cache import json_dumps, orjson
+from log import logger_factory
+from object_bundle import BUNDLE_DIRECTORY, fs_calls, is_fresh, stat_sources
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logger_factory.get_logger(__name__)
+
+# 图集放在物体目录的 .cache 下，不会被 central_crop_script.py 当作孤立输出删除，也不会触发重新加载
+ATLAS_DIRECTORY = f"{BUNDLE_DIRECTORY}/atlas"
+# 单张图集的最大边长（像素），放不下时分为多张
+ATLAS_MAX_SIZE = 2048
+# 清单结构变化时递增，旧版本的清单视为过期
+ATLAS_FORMAT = 1
+SAVE_OPTIONS = {
+    "jpg": ("JPEG", {"quality": 85}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+
+
+def atlas_supported() -> bool:
+    return Image is not None
+
+
+def atlas_name(directory: str, fmt: str) -> str:
+    # images_square -> square_jpg，images_square/256 -> square_256_webp
+    return f"{directory.replace('images_', '', 1).replace('/', '_')}_{fmt}"
+
+
+def pack(sizes: List[Tuple[int, int]], max_size: int = ATLAS_MAX_SIZE):
+    # 按行摆放，一行放满换行，一张放满换下一张；缩略图尺寸相同时等价于网格。
+    # 返回每个图片的 (图集序号, x, y) 和每张图集的 (宽, 高)
+    placements, sheets = [], []
+    x = y = row_height = width = 0
+    for w, h in sizes:
+        if x > 0 and x + w > max_size:
+            x, y, row_height = 0, y + row_height, 0
+        if x == 0 and y > 0 and y + h > max_size:
+            sheets.append((width, y))
+            y = width = 0
+        placements.append((len(sheets), x, y))
+        x += w
+        row_height = max(row_height, h)
+        width = max(width, x)
+    sheets.append((width, y + row_height))
+    return placements, sheets
+
+
+def manifest_path(object_path: str, name: str) -> str:
+    return os.path.join(object_path, ATLAS_DIRECTORY, f"{name}.json")
+
+
+def build_atlas(object_path: str, files: List[str], name: str, fmt: str) -> Dict:
+    # files 为相对物体目录的缩略图路径（同一目录）；清单中每个缩略图为 [图集序号, x, y, w, h]。
+    # 先记录源文件状态再读取，生成期间被修改的缩略图会使清单过期
+    sources = stat_sources(object_path, [os.path.dirname(files[0])] + files)
+    # 图集文件名带源文件状态的摘要，缩略图更新后 URL 随之变化，不会命中浏览器中的旧图集
+    digest = hashlib.blake2b(json.dumps(sources).encode("utf-8"), digest_size=4).hexdigest()
+    directory = os.path.join(object_path, ATLAS_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+
+    sizes = []
+    for file in files:
+        with Image.open(os.path.join(object_path, file)) as img:
+            sizes.append(img.size)
+    placements, sheet_sizes = pack(sizes)
+    canvases = [Image.new("RGB", size) for size in sheet_sizes]
+    for file, (sheet, x, y) in zip(files, placements):
+        with Image.open(os.path.join(object_path, file)) as img:
+            canvases[sheet].paste(img.convert("RGB"), (x, y))
+
+    image_format, options = SAVE_OPTIONS[fmt]
+    sheets = []
+    for i, canvas in enumerate(canvases):
+        sheet = f"{name}_{digest}_{i}.{fmt}"
+        tmp = os.path.join(directory, f"{sheet}.{os.getpid()}.tmp")
+        canvas.save(tmp, image_format, **options)
+        os.replace(tmp, os.path.join(directory, sheet))
+        sheets.append(sheet)
+
+    manifest = {
+        "format": ATLAS_FORMAT,
+        "sources": sources,
+        "sheets": sheets,
+        "tiles": {file: [sheet, x, y, w, h] for file, (sheet, x, y), (w, h) in zip(files, placements, sizes)},
+    }
+    output = manifest_path(object_path, name)
+    tmp = f"{output}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as file:
+        file.write(json_dumps(manifest))
+    os.replace(tmp, output)
+
+    # 删除同名的旧图集
+    for file in os.listdir(directory):
+        if file.startswith(f"{name}_") and file.endswith(f".{fmt}") and file not in sheets:
+            os.remove(os.path.join(directory, file))
+    logger.info("built atlas %s for %s: %d images in %d sheets.", name, object_path, len(files), len(sheets))
+    return manifest
+
+
+def load_atlas(object_path: str, name: str) -> Optional[Dict]:
+    # 不存在、格式不符或缩略图已变化时返回 None
+    path = manifest_path(object_path, name)
+    fs_calls.inc("open")
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    try:
+        manifest = orjson.loads(data) if orjson is not None else json.loads(data)
+    except ValueError as ex:
+        logger.warning("invalid atlas manifest %s: %s.", path, ex)
+        return None
+    if manifest.get("format") != ATLAS_FORMAT or not is_fresh(object_path, manifest["sources"]):
+        return None
+    return manifest
+
+
+def get_atlas(object_path: str, files: List[str], name: str, fmt: str) -> Optional[Dict]:
+    # 优先使用磁盘上最新的图集，否则重新生成；没有安装 Pillow 时返回 None
+    manifest = load_atlas(object_path, name)
+    if manifest is not None or Image is None:
+        return manifest
+    return build_atlas(object_path, files, name, fmt)
@@ -0,0 +1,122 @@
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from http_cache import EncodedPayload, brotli, compress
+from log import logger_factory
+
+logger = logger_factory.get_logger(__name__)
+
+# vite 输出的带内容哈希的文件名，例如 index-CVbE00YX.js
+HASHED_ASSET_PATTERN = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# 构建时预压缩文件的后缀
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def guess_media_type(file: str) -> str:
+    if file.endswith(".js"):
+        return "text/javascript"
+    return mimetypes.guess_type(file)[0] or "application/octet-stream"
+
+
+class StaticAssets:
+    # 前端静态文件常驻内存：按 Accept-Encoding 返回预压缩版本，带哈希的文件名长期缓存，其他文件每次校验 ETag
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        # 文件名 -> (mtime_ns, payload)
+        self.assets: Dict[str, Tuple[int, EncodedPayload]] = dict()
+
+    def _path(self, name: str) -> Optional[str]:
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            return None
+        return os.path.join(self.directory, name)
+
+    def _load(self, name: str, path: str, mtime_ns: int) -> EncodedPayload:
+        with open(path, "rb") as file:
+            body = file.read()
+        media_type = guess_media_type(name)
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_ASSET_PATTERN.search(name) else REVALIDATE_CACHE_CONTROL
+        compressible = media_type.startswith(COMPRESSIBLE_TYPES)
+        if media_type.startswith("text/"):
+            media_type = f"{media_type}; charset=utf-8"
+        payload = EncodedPayload(body, media_type, cache_control, compressible)
+        if compressible:
+            for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+                try:
+                    if os.stat(path + suffix).st_mtime_ns >= mtime_ns:
+                        with open(path + suffix, "rb") as file:
+                            payload.set_variant(encoding, file.read())
+                except OSError:
+                    pass
+        return payload
+
+    def get(self, name: str) -> Optional[EncodedPayload]:
+        path = self._path(name)
+        if path is None:
+            return None
+        item = self.assets.get(name)
+        # 带哈希的文件内容不会变化，无需再检查文件
+        if item is not None and item[1].cache_control == IMMUTABLE_CACHE_CONTROL:
+            return item[1]
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if item is not None and item[0] == mtime_ns:
+            return item[1]
+
+        payload = self._load(name, path, mtime_ns)
+        with self.lock:
+            self.assets[name] = (mtime_ns, payload)
+        return payload
+
+    def preload(self):
+        # 启动时读入全部文件并生成压缩版本，避免首个请求承担压缩开销
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(tuple(PRECOMPRESSED_SUFFIXES.values())):
+                continue
+            payload = self.get(name)
+            if payload is None:
+                continue
+            for encoding in payload.available_encodings():
+                payload.variant(encoding)
+        logger.info("preloaded %d static assets from %s.", len(self.assets), self.directory)
+
+    def response(self, request: Request, name: str) -> Response:
+        payload = self.get(name)
+        if payload is None:
+            return Response(status_code=404)
+        return payload.to_response(request)
+
+
+def precompress(directory: str):
+    # 构建时执行：为可压缩文件生成最高压缩级别的 .gz / .br
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(tuple(PRECOMPRESSED_SUFFIXES.values())) or not os.path.isfile(path):
+            continue
+        if not guess_media_type(name).startswith(COMPRESSIBLE_TYPES):
+            continue
+        with open(path, "rb") as file:
+            body = file.read()
+        encodings = {"gzip": 9, "br": 11} if brotli is not None else {"gzip": 9}
+        for encoding, level in encodings.items():
+            with open(path + PRECOMPRESSED_SUFFIXES[encoding], "wb") as file:
+                file.write(compress(body, encoding, level))
+        logger.info("precompressed %s.", path)
+
+
+if __name__ == '__main__':
+    precompress("static/assets")
+    precompress("static")
@@ -1,11 +1,20 @@
 import asyncio
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, Optional
 
 from starlette.websockets import WebSocket
 
+from display_state import DEFAULT_CHANNEL
 from log import logger_factory
+from metrics import registry
 
-logger = logger_factory.get_logger(__name__)
+logger = logger_factory.get_logger(__name__, rate_limited=True)
+
+ws_publish_duration = registry.histogram("ws_publish_duration_seconds",
+                                         "Time to enqueue one message for all WebSocket subscribers.")
+ws_send_failures = registry.counter("ws_send_failures_total", "WebSocket sends that failed or timed out.")
+ws_dropped_messages = registry.counter("ws_dropped_messages_total",
+                                       "Messages dropped because a subscriber queue was full.")
 
 
 class Res:
@@ -18,40 +27,77 @@ class Res:
         return Res.res("message", content=msg)
 
 
+class Subscriber:
+    # 单个连接的发送队列，队列满时丢弃最旧的消息，只保留最新状态
+    def __init__(self, ws: WebSocket, queue_size: int, channel: str = DEFAULT_CHANNEL):
+        self.ws = ws
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, msg: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            ws_dropped_messages.inc()
+        self.queue.put_nowait(msg)
+
+
 class WebSocketsManager:
-    def __init__(self):
-        self.lock = asyncio.Lock()
-        self.store: List[WebSocket] = []
+    def __init__(self, queue_size: int = 4, send_timeout: float = 5.0):
+        # 每个连接的待发送消息上限，以及单次发送允许阻塞的最长时间（秒），超时的连接会被移除
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.store: Dict[WebSocket, Subscriber] = dict()
+        # 频道 -> 订阅该频道的连接，广播只遍历对应频道；频道没有连接时删除
+        self.channels: Dict[str, Dict[WebSocket, Subscriber]] = dict()
 
-    async def add(self, ws: WebSocket):
-        async with self.lock:
-            self.store.append(ws)
+    async def add(self, ws: WebSocket, initial: Optional[str] = None, channel: str = DEFAULT_CHANNEL):
+        subscriber = Subscriber(ws, self.queue_size, channel)
+        if initial is not None:
+            # 在加入 store 之前入队，保证初始快照先于之后的广播发送
+            subscriber.offer(initial)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+        self.store[ws] = subscriber
+        members = self.channels.get(channel)
+        if members is None:
+            members = self.channels[channel] = dict()
+        members[ws] = subscriber
 
     async def remove(self, ws: WebSocket):
-        async with self.lock:
-            if ws in self.store:
-                logger.debug("remove, remove ws.")
-                self.store.remove(ws)
+        subscriber = self.store.pop(ws, None)
+        if subscriber is not None:
+            members = self.channels.get(subscriber.channel)
+            if members is not None:
+                members.pop(ws, None)
+                if not members:
+                    del self.channels[subscriber.channel]
+            logger.debug("remove, remove ws.")
+            if subscriber.task is not asyncio.current_task():
+                subscriber.task.cancel()
+        try:
+            logger.debug("remove, close ws.")
+            await asyncio.wait_for(ws.close(), self.send_timeout)
+        except Exception as ex:
+            logger.debug(ex)
+
+    async def publish(self, msg: str, channel: str = DEFAULT_CHANNEL):
+        # 只把消息放入该频道各连接的队列，不等待网络发送
+        start = time.perf_counter()
+        members = self.channels.get(channel)
+        if not members:
+            return
+        for subscriber in list(members.values()):
+            subscriber.offer(msg)
+        ws_publish_duration.observe(time.perf_counter() - start)
+
+    async def _sender(self, subscriber: Subscriber):
+        ws = subscriber.ws
+        while True:
+            msg = await subscriber.queue.get()
             try:
-                logger.debug("remove, close ws.")
-                await ws.close()
+                await asyncio.wait_for(ws.send_text(msg), self.send_timeout)
             except Exception as ex:
-                logger.debug(ex)
-
-    async def publish(self, msg: str):
-        async with self.lock:
-            # 遍历列表的过程中使用await，需要加锁，加协程锁
-            for ws in self.store:
-                try:
-                    await ws.send_text(msg)
-                except Exception as ex:
-                    logger.debug(ex)
-                    if ws in self.store:
-                        logger.debug(f"publish failed, remove ws {ws}.")
-                        self.store.remove(ws)
-
-                    try:
-                        await ws.close()
-                        logger.debug("publish, close ws.")
-                    except Exception as ex:
-                        logger.debug(ex)
+                ws_send_failures.inc()
+                logger.debug("publish failed, remove ws %s: %r.", ws, ex)
+                await self.remove(ws)
+                return
@@ -0,0 +1,127 @@
+import math
+import os
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from starlette.responses import Response
+
+from log import logger_factory
+from object_bundle import fs_calls
+
+logger = logger_factory.get_logger(__name__)
+
+# 二进制向量缓存放在物体目录下的隐藏目录，避免被当作 *vector* 源文件扫描到
+VECTOR_CACHE_DIRECTORY = ".cache"
+VECTOR_CACHE_FILE = "vectors.npy"
+
+# 二进制响应头：行数、每行的位串数、每个位串的位数，均为 little-endian uint32，之后是 uint8（0 或 1）行主序数据
+BINARY_HEADER = struct.Struct("<III")
+
+
+def parse_vectors(text: str) -> np.ndarray:
+    # 向量文件每行为空白分隔的等长位串（如 0110101001），转换为 (行数, 位串数, 位数) 的 uint8 数组，每个元素为一位
+    rows = [line.split() for line in text.splitlines() if line.strip()]
+    if not rows:
+        return np.zeros((0, 0, 0), dtype=np.uint8)
+    strings = len(rows[0])
+    if any(len(row) != strings for row in rows):
+        raise ValueError("every vector row must have the same number of bit strings.")
+    tokens = [token for row in rows for token in row]
+    digits = len(tokens[0])
+    if any(len(token) != digits for token in tokens):
+        raise ValueError("every bit string must have the same length.")
+    bits = np.frombuffer("".join(tokens).encode("ascii"), dtype=np.uint8) - ord("0")
+    if bits.size and bits.max() > 1:
+        raise ValueError("bit strings may only contain 0 and 1.")
+    return bits.reshape(len(rows), strings, digits)
+
+
+def is_bit_array(array: np.ndarray) -> bool:
+    # 旧版本的缓存为 float32 二维数组，需要重新转换
+    return array.dtype == np.uint8 and array.ndim == 3
+
+
+def cache_path(vector_file: str) -> str:
+    return os.path.join(os.path.dirname(vector_file), VECTOR_CACHE_DIRECTORY, VECTOR_CACHE_FILE)
+
+
+def convert(vector_file: str, output: Optional[str] = None) -> np.ndarray:
+    output = output or cache_path(vector_file)
+    with open(vector_file, "r", encoding="utf-8") as file:
+        array = parse_vectors(file.read())
+    try:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        tmp = f"{output}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as file:
+            np.save(file, array)
+        os.replace(tmp, output)
+    except OSError as ex:
+        # 目录只读时退化为仅在内存中保存
+        logger.warning("can not write vector cache %s: %s.", output, ex)
+        return array
+    return np.load(output, mmap_mode="r")
+
+
+class VectorStore:
+    # 向量文件 -> 只读 mmap 的位数组，源文件更新后重新转换
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrays: Dict[str, Tuple[int, np.ndarray]] = dict()
+
+    def get(self, vector_file: str) -> np.ndarray:
+        fs_calls.inc("stat")
+        mtime_ns = os.stat(vector_file).st_mtime_ns
+        item = self.arrays.get(vector_file)
+        if item is not None and item[0] == mtime_ns:
+            return item[1]
+
+        with self.lock:
+            item = self.arrays.get(vector_file)
+            if item is not None and item[0] == mtime_ns:
+                return item[1]
+            array = self._load(vector_file, mtime_ns)
+            self.arrays[vector_file] = (mtime_ns, array)
+            return array
+
+    def _load(self, vector_file: str, mtime_ns: int) -> np.ndarray:
+        path = cache_path(vector_file)
+        fs_calls.inc("stat")
+        try:
+            if os.stat(path).st_mtime_ns >= mtime_ns:
+                array = np.load(path, mmap_mode="r")
+                if is_bit_array(array):
+                    return array
+        except (OSError, ValueError):
+            pass
+        logger.info("converting vectors %s.", vector_file)
+        return convert(vector_file, path)
+
+    def invalidate(self, vector_file: str):
+        with self.lock:
+            self.arrays.pop(vector_file, None)
+
+
+def select_rows(array: np.ndarray, start: int = 0, stop: Optional[int] = None, stride: int = 1,
+                max_rows: Optional[int] = None) -> np.ndarray:
+    if stride < 1:
+        raise ValueError("stride must be positive.")
+    rows = array[start:stop]
+    if max_rows is not None:
+        if max_rows < 1:
+            raise ValueError("max_rows must be positive.")
+        # 按 LOD 要求放大步长，使返回行数不超过 max_rows
+        stride = max(stride, math.ceil(len(rows) / max_rows))
+    return rows[::stride]
+
+
+def to_binary(array: np.ndarray) -> bytes:
+    array = np.ascontiguousarray(array, dtype=np.uint8)
+    return BINARY_HEADER.pack(*array.shape) + array.tobytes()
+
+
+def binary_response(array: np.ndarray) -> Response:
+    rows, strings, digits = array.shape
+    return Response(content=to_binary(array), media_type="application/octet-stream",
+                    headers={"X-Vector-Shape": f"{rows},{strings},{digits}", "Cache-Control": "no-cache"})
@@ -0,0 +1,27 @@
+import asyncio
+import os
+from typing import AsyncIterator
+
+from object_bundle import BUNDLE_DIRECTORY
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+
+def outside_cache(_change, path: str) -> bool:
+    # 运行时写入的 .cache（向量转换、预编译产物）不触发重新加载
+    return BUNDLE_DIRECTORY not in path.split(os.sep)
+
+
+async def watch_directory(directory: str, interval: float) -> AsyncIterator[None]:
+    # 目录可能有变化时产出，由调用方做增量检查；安装了 watchfiles 时使用文件系统事件，否则每 interval 秒产出一次
+    if awatch is not None and os.path.isdir(directory):
+        async for _ in awatch(directory, watch_filter=outside_cache):
+            yield
+        return
+    while True:
+        await asyncio.sleep(interval)
+        if os.path.isdir(directory):
+            yield